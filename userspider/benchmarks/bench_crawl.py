@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""在本地模拟接口上端到端运行爬虫，统计吞吐、延迟和等待时间
+
+python bench_crawl.py --users 20 --concurrency 4 --latency 0.05
+
+--concurrency为1时运行Weibo.start()，大于1时运行AsyncWeibo.start()。
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from fake_weibo import add_arguments, from_arguments
+from spider import AsyncWeibo, Weibo
+
+
+class TimedClient(object):
+    """记录每个接口请求的耗时"""
+    def __init__(self, api):
+        self.api = api
+        self.lock = threading.Lock()
+        self.latencies = []
+
+    def get(self, url, **kwargs):
+        start = time.time()
+        try:
+            return self.api.get(url, **kwargs)
+        finally:
+            with self.lock:
+                self.latencies.append(time.time() - start)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--since-date', default='2000-01-01')
+    parser.add_argument('--write-mode', nargs='*', default=[])
+    parser.add_argument('--download', action='store_true')
+    parser.add_argument('--rate', type=float, default=0.5)
+    parser.add_argument('--max-rate', type=float, default=5.0)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = from_arguments(args).start()
+    work_dir = tempfile.mkdtemp()
+    config = {
+        'user_id_list': [str(1000000 + i) for i in range(args.users)],
+        'filter': 0,
+        'since_date': args.since_date,
+        'write_mode': args.write_mode,
+        'original_pic_download': int(args.download),
+        'retweet_pic_download': 0,
+        'original_video_download': 0,
+        'retweet_video_download': 0,
+        'print_debug': 0,
+        'db_config': '',
+        'cookie': '',
+        'api_base': fake.url,
+        'concurrency': args.concurrency,
+        'rate_limit': {
+            'rate': args.rate,
+            'max_rate': args.max_rate
+        },
+        'status_cache': {
+            'path': work_dir + os.sep + 'status_cache.db'
+        }
+    }
+    if args.concurrency > 1:
+        engine = AsyncWeibo(config)
+        wb = engine.weibo
+    else:
+        engine = wb = Weibo(config)
+    timed = TimedClient(wb.api)
+    wb.api = timed
+
+    start = time.time()
+    engine.start()
+    elapsed = time.time() - start
+    fake.stop()
+    shutil.rmtree(work_dir)
+
+    counts = fake.counts
+    print('=' * 60)
+    print(u'engine:          %s (concurrency %d)' %
+          (type(engine).__name__, args.concurrency))
+    print(u'elapsed:         %.2fs' % elapsed)
+    print(u'users/hour:      %.0f' % (args.users / elapsed * 3600))
+    print(u'pages/sec:       %.2f' % (counts.get('page', 0) / elapsed))
+    print(u'requests:        %d (%d user, %d page, %d detail, %d limited)' %
+          (len(timed.latencies), counts.get('user', 0), counts.get(
+              'page', 0), counts.get('detail', 0), counts.get('limited', 0)))
+    print(u'latency p50/p99: %.1fms / %.1fms' %
+          (percentile(timed.latencies, 50) * 1000,
+           percentile(timed.latencies, 99) * 1000))
+    print(u'sleeping:        %.2fs (summed over threads)' %
+          wb.limiter.stats()['slept'])
+    print(u'final rate:      %.2f req/s' % wb.limiter.rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""对比原xpath解析与weibo_parser.parse_text的结果和速度
+
+python bench_parser.py [语料.jsonl] [重复次数]
+
+语料每行为一条mblog.text的json字符串，或带text字段的mblog/card对象。
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lxml import etree
+
+from spider import Weibo
+from weibo_parser import parse_text
+
+
+def load_corpus(file_path):
+    corpus = []
+    with open(file_path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line.decode('utf-8'))
+            if isinstance(item, dict):
+                item = item.get('mblog', item)['text']
+            corpus.append(item)
+    return corpus
+
+
+def legacy_parse_text(text_body):
+    """parse_weibo原来的解析方式"""
+    selector = etree.HTML(text_body)
+    text = etree.HTML(text_body).xpath('string(.)')
+    location = Weibo.get_location(None, selector)
+    topics = Weibo.get_topics(None, selector)
+    at_users = Weibo.get_at_users(None, selector)
+    return text, location, topics, at_users
+
+
+def run(parse, corpus, repeat):
+    start = time.time()
+    for i in range(repeat):
+        for text_body in corpus:
+            try:
+                parse(text_body)
+            except Exception:
+                pass
+    return len(corpus) * repeat / (time.time() - start)
+
+
+def result(parse, text_body):
+    try:
+        return parse(text_body)
+    except Exception as e:
+        return type(e)
+
+
+def main():
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else os.path.split(
+        os.path.realpath(__file__))[0] + os.sep + 'mblog_text_samples.jsonl'
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    corpus = load_corpus(corpus_path)
+    mismatch = 0
+    for text_body in corpus:
+        expected = result(legacy_parse_text, text_body)
+        actual = result(parse_text, text_body)
+        # 原实现没有href时抛IndexError，这里视为同样的失败
+        if isinstance(expected, type) and isinstance(actual, type):
+            continue
+        if expected != actual:
+            mismatch += 1
+            print(u'Mismatch: %s\n  xpath:  %s\n  single: %s' %
+                  (text_body, expected, actual))
+    print(u'%d samples, %d mismatches' % (len(corpus), mismatch))
+    print(u'xpath:       %.0f weibos/s' % run(legacy_parse_text, corpus, repeat))
+    print(u'single pass: %.0f weibos/s' % run(parse_text, corpus, repeat))
+    if mismatch:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""对比OrderedDict与WeiboRecord保存微博的内存占用和序列化耗时
+
+python bench_records.py [微博数]
+
+每条微博的字段与parse_weibo一致，三成为带retweet的转发微博。
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from records import WEIBO_FIELDS, WeiboRecord
+
+
+def weibo_values(i):
+    """第i条微博各字段的值，按WEIBO_FIELDS的顺序，不含retweet"""
+    return [
+        1000000 + i % 97, u'用户%d' % (i % 97), 4400000000000000 + i,
+        'I%dx' % i,
+        u'第%d条微博，今天天气不错 @好友%d #话题%d#' % (i, i % 7, i % 5),
+        'https://wx1.sinaimg.cn/large/%d.jpg' % i if i % 5 == 0 else '',
+        '', u'北京' if i % 11 == 0 else '', '2020-03-%02d' % (i % 28 + 1),
+        u'iPhone客户端', i % 1000, i % 100, i % 50,
+        u'话题%d' % (i % 5) if i % 3 == 0 else '',
+        u'好友%d' % (i % 7)
+    ]
+
+
+def build_dicts(count):
+    weibo_list = []
+    for i in range(count):
+        weibo = OrderedDict(zip(WEIBO_FIELDS, weibo_values(i)))
+        if i % 10 < 3:
+            weibo['retweet'] = OrderedDict(
+                zip(WEIBO_FIELDS, weibo_values(i + count)))
+        weibo_list.append(weibo)
+    return weibo_list
+
+
+def build_records(count):
+    weibo_list = []
+    for i in range(count):
+        weibo = WeiboRecord(zip(WEIBO_FIELDS, weibo_values(i)))
+        if i % 10 < 3:
+            weibo['retweet'] = WeiboRecord(
+                zip(WEIBO_FIELDS, weibo_values(i + count)))
+        weibo_list.append(weibo)
+    return weibo_list
+
+
+def dict_csv_row(w):
+    """原get_write_info的展开方式"""
+    wb = OrderedDict()
+    for k, v in w.items():
+        if k not in ['user_id', 'screen_name', 'retweet']:
+            wb[k] = v
+    if w.get('retweet'):
+        wb['is_original'] = False
+        for k2, v2 in w['retweet'].items():
+            wb['retweet_' + k2] = v2
+    else:
+        wb['is_original'] = True
+    return list(wb.values())
+
+
+def measure_memory(build, count):
+    tracemalloc.start()
+    weibo_list = build(count)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return weibo_list, size / float(count)
+
+
+def measure(func, weibo_list):
+    start = time.time()
+    for w in weibo_list:
+        func(w)
+    return (time.time() - start) / len(weibo_list) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dicts, dict_size = measure_memory(build_dicts, count)
+    records, record_size = measure_memory(build_records, count)
+    writer = csv.writer(io.StringIO())
+    if [dict_csv_row(w) for w in dicts[:100]] != [
+            w.csv_row() for w in records[:100]
+    ] or [json.dumps(w) for w in dicts[:100]
+          ] != [json.dumps(w.to_dict()) for w in records[:100]]:
+        sys.exit(u'WeiboRecord output differs from OrderedDict')
+
+    rows = [
+        ('memory (bytes/weibo)', dict_size, record_size),
+        ('json (us/weibo)', measure(json.dumps, dicts),
+         measure(lambda w: json.dumps(w.to_dict()), records)),
+        ('csv row (us/weibo)',
+         measure(lambda w: writer.writerow(dict_csv_row(w)), dicts),
+         measure(lambda w: writer.writerow(w.csv_row()), records)),
+        ('tuple (us/weibo)', measure(lambda w: tuple(w.values()), dicts),
+         measure(WeiboRecord.to_tuple, records)),
+    ]
+    print(u'%d weibos, 30%% retweets' % count)
+    print(u'%-22s %12s %12s' % ('', 'OrderedDict', 'WeiboRecord'))
+    for name, before, after in rows:
+        print(u'%-22s %12.1f %12.1f' % (name, before, after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""本地模拟的m.weibo.cn接口，用于离线压测爬虫
+
+提供100505(用户信息)、107603(分页微博)、/detail/<id>长微博页面和
+/media/图片视频，延迟、页数、长微博比例及限流行为均可配置。
+
+python fake_weibo.py --port 8080 --pages 5 --latency 0.05 --limit-per-minute 600
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+POSTS_PER_DAY = 2
+POPULAR_COUNT = 50
+
+
+class FakeWeiboHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        fake.delay()
+        if url.path.startswith('/media/'):
+            fake.count('media')
+            self.send(200, 'application/octet-stream', fake.media_body)
+            return
+        if fake.is_limited():
+            fake.count('limited')
+            if fake.limit_status != 200:
+                self.send(fake.limit_status, 'text/plain', b'')
+            else:
+                self.send(200, 'application/json', b'{"ok": 0}')
+            return
+        if url.path == '/api/container/getIndex':
+            params = parse_qs(url.query)
+            containerid = params.get('containerid', [''])[0]
+            page = int(params.get('page', ['1'])[0])
+            if containerid.startswith('100505'):
+                fake.count('user')
+                js = fake.user_info(int(containerid[6:]))
+            elif containerid.startswith('107603'):
+                fake.count('page')
+                js = fake.timeline(int(containerid[6:]), page)
+            else:
+                js = {'ok': 0}
+            self.send(200, 'application/json', json.dumps(js).encode('utf-8'))
+        elif url.path.startswith('/detail/'):
+            fake.count('detail')
+            html = fake.detail(url.path[len('/detail/'):])
+            self.send(200, 'text/html; charset=utf-8', html.encode('utf-8'))
+        else:
+            self.send(404, 'text/plain', b'')
+
+
+class FakeWeibo(object):
+    """为合成用户生成确定的用户信息、微博和长微博页面"""
+    def __init__(self,
+                 port=0,
+                 latency=0.0,
+                 jitter=0.0,
+                 pages=5,
+                 long_ratio=0.1,
+                 retweet_ratio=0.3,
+                 pic_ratio=0.2,
+                 media_size=20000,
+                 limit_per_minute=0,
+                 limit_status=200):
+        self.latency = latency
+        self.jitter = jitter
+        self.pages = pages
+        self.long_ratio = long_ratio
+        self.retweet_ratio = retweet_ratio
+        self.pic_ratio = pic_ratio
+        self.media_body = b'\0' * media_size
+        self.limit_per_minute = limit_per_minute
+        self.limit_status = limit_status
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.counts = {}
+        self.statuses = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), FakeWeiboHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.popular = [
+            self.status(4000000000000000 + i, 1000000000 + i, i, random.Random(i))
+            for i in range(POPULAR_COUNT)
+        ]
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.random() * self.jitter)
+
+    def is_limited(self):
+        """一分钟内的请求超过limit_per_minute后返回限流响应"""
+        if not self.limit_per_minute:
+            return False
+        now = time.time()
+        with self.lock:
+            while self.window and now - self.window[0] > 60:
+                self.window.popleft()
+            if len(self.window) >= self.limit_per_minute:
+                return True
+            self.window.append(now)
+            return False
+
+    def user_info(self, user_id):
+        rng = random.Random(user_id)
+        return {
+            'ok': 1,
+            'data': {
+                'userInfo': {
+                    'id': user_id,
+                    'screen_name': 'user_%d' % user_id,
+                    'gender': rng.choice(['f', 'm']),
+                    'statuses_count': self.pages * 10,
+                    'followers_count': rng.randint(0, 100000),
+                    'follow_count': rng.randint(0, 1000),
+                    'description': u'合成用户',
+                    'profile_url': 'https://m.weibo.cn/u/%d' % user_id,
+                    'verified': False
+                }
+            }
+        }
+
+    def status(self, weibo_id, user_id, index, rng):
+        text = u'第%d条微博 <a href=\'/n/好友%d\'>@好友%d</a>' % (index, index % 7,
+                                                           index % 7)
+        if index % 3 == 0:
+            text += (u'<a href="https://m.weibo.cn/search?containerid=231522">'
+                     u'<span class="surl-text">#话题%d#</span></a>' % (index % 5))
+        mblog = {
+            'id': str(weibo_id),
+            'bid': 'B%d' % weibo_id,
+            'text': text,
+            'created_at': str(date.today() -
+                              timedelta(days=index // POSTS_PER_DAY)),
+            'source': u'微博 weibo.com',
+            'attitudes_count': rng.randint(0, 1000),
+            'comments_count': rng.randint(0, 100),
+            'reposts_count': rng.randint(0, 100),
+            'user': {
+                'id': user_id,
+                'screen_name': 'user_%d' % user_id
+            },
+            'isLongText': rng.random() < self.long_ratio
+        }
+        if rng.random() < self.pic_ratio:
+            mblog['pics'] = [{
+                'large': {
+                    'url': self.url + '/media/%d_%d.jpg' % (weibo_id, i)
+                }
+            } for i in range(rng.randint(1, 3))]
+        with self.lock:
+            self.statuses[str(weibo_id)] = mblog
+        return mblog
+
+    def timeline(self, user_id, page):
+        if page > self.pages:
+            return {'ok': 1, 'data': {'cards': []}}
+        cards = []
+        base = 4400000000000000 + (user_id % 10**7) * 10**5
+        for index in range((page - 1) * 10, page * 10):
+            rng = random.Random(user_id * 100000 + index)
+            mblog = self.status(base + self.pages * 10 - index, user_id, index,
+                                rng)
+            if rng.random() < self.retweet_ratio:
+                mblog['retweeted_status'] = rng.choice(self.popular)
+            cards.append({'card_type': 9, 'mblog': mblog})
+        return {'ok': 1, 'data': {'cards': cards}}
+
+    def detail(self, weibo_id):
+        """与m.weibo.cn/detail相同结构的页面，status中为全文"""
+        with self.lock:
+            mblog = self.statuses.get(weibo_id)
+        if not mblog:
+            return u'<html></html>'
+        status = dict(mblog, text=mblog['text'] + u'全文' * 100)
+        status.pop('retweeted_status', None)
+        render_data = json.dumps(
+            {
+                'status': status,
+                'call': '1',
+                'hotScheme': 'sinaweibo://detail?mblogid=%s' % weibo_id
+            },
+            ensure_ascii=False)
+        return (u'<html><body><script>var $render_data = [%s][0] || {};'
+                u'</script></body></html>' % render_data)
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_arguments(parser):
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--long-ratio', type=float, default=0.1)
+    parser.add_argument('--retweet-ratio', type=float, default=0.3)
+    parser.add_argument('--pic-ratio', type=float, default=0.2)
+    parser.add_argument('--limit-per-minute', type=int, default=0)
+    parser.add_argument('--limit-status', type=int, default=200)
+
+
+def from_arguments(args, port=0):
+    return FakeWeibo(port=port,
+                     latency=args.latency,
+                     jitter=args.jitter,
+                     pages=args.pages,
+                     long_ratio=args.long_ratio,
+                     retweet_ratio=args.retweet_ratio,
+                     pic_ratio=args.pic_ratio,
+                     limit_per_minute=args.limit_per_minute,
+                     limit_status=args.limit_status)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = from_arguments(args, args.port)
+    print(u'Fake weibo api running at %s' % fake.url)
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+PENDING = 'pending'
+LEASED = 'leased'
+FINISHED = 'finished'
+SEEDED = 'seeded'
+
+
+def coordinator_path(user_config_file_path):
+    """user_id_list文件对应的任务数据库路径"""
+    return user_config_file_path + '.coordinator.db'
+
+
+class LeaseCoordinator(object):
+    """多个爬虫进程共同消费同一个user_id_list
+
+    全部待爬取用户存入SQLite任务表，每个进程按批认领用户并获得有时限的租约，
+    爬取期间后台线程定期续约，爬完后释放。进程退出或崩溃后租约过期，
+    其中的用户会被其他进程重新认领。
+    """
+    def __init__(self,
+                 path,
+                 worker_id='',
+                 batch_size=10,
+                 lease=600,
+                 max_attempts=3,
+                 poll=10):
+        self.path = path
+        self.worker_id = worker_id or '%s:%d' % (socket.gethostname(),
+                                                 os.getpid())
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts  # 多次爬取失败的用户不再分配
+        self.poll = poll  # 其他进程仍持有租约时，等待其完成或过期的轮询间隔
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat = None
+        self.connection = sqlite3.connect(path,
+                                          timeout=60,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS task (
+            user_id TEXT PRIMARY KEY,
+            since_date TEXT NOT NULL,
+            state TEXT NOT NULL,
+            owner TEXT,
+            expires REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0)""")
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS task_state ON task (state, expires)')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT)""")
+
+    def transaction(self, func, *args):
+        """在BEGIN IMMEDIATE事务中执行，多个进程的认领互不重叠"""
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(*args)
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+            return result
+
+    def seed(self, user_loader):
+        """把user_id_list中待爬取的用户写入任务表，同一版本的文件只写入一次"""
+        def insert():
+            row = self.connection.execute(
+                'SELECT value FROM meta WHERE key = ?', (SEEDED, )).fetchone()
+            if row and row[0] == user_loader.file_key():
+                return 0
+            cursor = self.connection.executemany(
+                'INSERT OR IGNORE INTO task (user_id, since_date, state) '
+                'VALUES (?, ?, ?)',
+                ((user_config['user_id'], user_config['since_date'], PENDING)
+                 for user_config in user_loader))
+            self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                    (SEEDED, user_loader.file_key()))
+            return cursor.rowcount
+
+        count = self.transaction(insert)
+        if count:
+            print(u'%d users queued in %s' % (count, self.path))
+        return count
+
+    def claim(self):
+        """认领一批用户，优先认领租约已过期的用户"""
+        def update():
+            now = time.time()
+            rows = self.connection.execute(
+                'SELECT user_id, since_date FROM task '
+                'WHERE state = ? AND expires < ? AND attempts < ? LIMIT ?',
+                (LEASED, now, self.max_attempts, self.batch_size)).fetchall()
+            if len(rows) < self.batch_size:
+                rows += self.connection.execute(
+                    'SELECT user_id, since_date FROM task '
+                    'WHERE state = ? AND attempts < ? LIMIT ?',
+                    (PENDING, self.max_attempts,
+                     self.batch_size - len(rows))).fetchall()
+            self.connection.executemany(
+                'UPDATE task SET state = ?, owner = ?, expires = ?, '
+                'attempts = attempts + 1 WHERE user_id = ?',
+                [(LEASED, self.worker_id, now + self.lease, row[0])
+                 for row in rows])
+            return rows
+
+        rows = self.transaction(update)
+        if rows:
+            self.start_heartbeat()
+        return [{
+            'user_id': user_id,
+            'since_date': since_date,
+            'ifPass': False
+        } for user_id, since_date in rows]
+
+    def renew(self):
+        """延长本进程持有的全部租约"""
+        with self.lock:
+            self.connection.execute(
+                'UPDATE task SET expires = ? WHERE state = ? AND owner = ?',
+                (time.time() + self.lease, LEASED, self.worker_id))
+
+    def run_heartbeat(self):
+        while not self.stopped.wait(self.lease / 3.0):
+            try:
+                self.renew()
+            except sqlite3.Error as e:
+                print('Error: ', e)
+
+    def start_heartbeat(self):
+        if self.heartbeat is None:
+            self.heartbeat = threading.Thread(target=self.run_heartbeat)
+            self.heartbeat.daemon = True
+            self.heartbeat.start()
+
+    def release(self, user_id, finished=True):
+        """爬完后释放用户；finished为False时放回队列，由其他进程重试"""
+        with self.lock:
+            self.connection.execute(
+                'UPDATE task SET state = ?, owner = NULL, expires = 0 '
+                'WHERE user_id = ? AND owner = ?',
+                (FINISHED if finished else PENDING, str(user_id),
+                 self.worker_id))
+
+    def others_leased(self):
+        """其他进程持有的租约数，包括尚未被重新认领的过期租约"""
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM task WHERE state = ? AND owner != ? '
+                'AND attempts < ?',
+                (LEASED, self.worker_id, self.max_attempts)).fetchone()[0]
+
+    def __iter__(self):
+        """依次产出认领到的用户，直到任务表中没有可认领的用户"""
+        while True:
+            batch = self.claim()
+            if not batch:
+                if not self.others_leased():
+                    return
+                time.sleep(self.poll)
+                continue
+            for user_config in batch:
+                yield user_config
+
+    def stats(self):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT state, COUNT(*) FROM task GROUP BY state').fetchall()
+            failed = self.connection.execute(
+                'SELECT COUNT(*) FROM task WHERE state != ? AND attempts >= ?',
+                (FINISHED, self.max_attempts)).fetchone()[0]
+        stats = dict((state, 0) for state in [PENDING, LEASED, FINISHED])
+        stats.update(rows)
+        stats['failed'] = failed
+        return stats
+
+    def close(self):
+        """停止续约，未爬完的用户立即放回队列"""
+        self.stopped.set()
+        with self.lock:
+            self.connection.execute(
+                'UPDATE task SET state = ?, owner = NULL, expires = 0, '
+                'attempts = attempts - 1 WHERE state = ? AND owner = ?',
+                (PENDING, LEASED, self.worker_id))
+        self.connection.close()
+
+
+def main():
+    """python coordinator.py status <user_id_list>"""
+    if len(sys.argv) < 3 or sys.argv[1] != 'status':
+        sys.exit(u'usage: python coordinator.py status <user_id_list>')
+    path = coordinator_path(sys.argv[2])
+    if not os.path.isfile(path):
+        sys.exit(u'%s non-exists' % path)
+    coordinator = LeaseCoordinator(path)
+    print(u'%(pending)d pending, %(leased)d leased, %(finished)d finished, '
+          u'%(failed)d failed' % coordinator.stats())
+    coordinator.connection.close()
+
+
+if __name__ == '__main__':
+    main()
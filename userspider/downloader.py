@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from http_client import HttpClient
+from metrics import Metrics, timed
+
+
+class MediaDownloader(object):
+    """用有界线程池下载图片/视频，分块写入磁盘并支持断点续传"""
+    def __init__(self,
+                 http,
+                 cookie=None,
+                 workers=4,
+                 queue_size=100,
+                 chunk_size=64 * 1024,
+                 metrics=None):
+        self.http = http
+        self.metrics = metrics or Metrics()
+        self.cookie = cookie
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # 队列已满时submit阻塞，避免爬取速度远超下载速度时无限堆积
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.condition = threading.Condition()
+        self.pending = 0
+        self.queued = set()  # 已在队列中或正在下载的文件路径
+        self.progress = None
+        self.downloaded_count = 0
+        self.failed_count = 0
+        self.byte_count = 0
+
+    def submit(self, url, file_path, error_file, weibo_id):
+        """将单个文件加入下载队列，已下载完成或已在队列中的文件直接跳过"""
+        if os.path.isfile(file_path):
+            return
+        with self.condition:
+            # 同一文件被两个线程同时写入.part会损坏
+            if file_path in self.queued:
+                return
+            self.queued.add(file_path)
+        self.slots.acquire()
+        with self.condition:
+            if self.progress is None:
+                self.progress = tqdm(total=0,
+                                     desc='Download progress',
+                                     unit='file')
+            self.pending += 1
+            self.progress.total += 1
+            self.progress.refresh()
+        self.executor.submit(self.run, url, file_path, error_file, weibo_id)
+
+    def run(self, url, file_path, error_file, weibo_id):
+        try:
+            self.download(url, file_path)
+            with self.condition:
+                self.downloaded_count += 1
+        except Exception as e:
+            with self.condition:
+                self.failed_count += 1
+            self.log_failure(url, file_path, error_file, weibo_id)
+            print('Error: ', e)
+            traceback.print_exc()
+        finally:
+            self.slots.release()
+            with self.condition:
+                self.queued.discard(file_path)
+                self.pending -= 1
+                self.progress.update(1)
+                self.progress.set_postfix(failed=self.failed_count,
+                                          mb=self.byte_count >> 20)
+                self.condition.notify_all()
+
+    @timed('download')
+    def download(self, url, file_path):
+        """流式下载，存在.part文件时用Range请求续传"""
+        part_path = file_path + '.part'
+        offset = os.path.getsize(part_path) if os.path.isfile(
+            part_path) else 0
+        headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+        r = self.http.get(url,
+                          cookies=self.cookie,
+                          headers=headers,
+                          stream=True)
+        try:
+            if offset and r.status_code == 416:
+                # Content-Range为bytes */总大小，与.part大小相同时.part已是完整文件
+                total = r.headers.get('Content-Range', '').rpartition('/')[2]
+                if total.isdigit() and int(total) == offset:
+                    os.replace(part_path, file_path)
+                    return
+                # .part与文件大小不符，删除后重新下载
+                os.remove(part_path)
+                return self.download(url, file_path)
+            r.raise_for_status()
+            mode = 'ab' if offset and r.status_code == 206 else 'wb'
+            size = 0
+            with open(part_path, mode) as f:
+                for chunk in r.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+                    with self.condition:
+                        self.byte_count += len(chunk)
+            self.metrics.add_bytes('download', size)
+        finally:
+            r.close()
+        os.replace(part_path, file_path)
+
+    def log_failure(self, url, file_path, error_file, weibo_id):
+        """记录下载失败的文件，格式为weibo_id:url\\tfile_path"""
+        with self.condition:
+            with open(error_file, 'ab') as f:
+                line = str(weibo_id) + ':' + url + '\t' + file_path + '\n'
+                f.write(line.encode('utf-8'))
+
+    def redownload(self, error_file):
+        """重新下载not_downloaded.txt中记录的全部文件，仍失败的会再次写入该文件
+
+        记录先移到.retry文件，全部下载结束后才删除，中断时下次会重新读取。
+        """
+        retry_file = error_file + '.retry'
+        if os.path.isfile(retry_file):
+            # 上次重新下载被中断，把之后新记录的失败合并进来
+            if os.path.isfile(error_file):
+                with open(retry_file, 'ab') as out, open(error_file,
+                                                         'rb') as f:
+                    out.write(f.read())
+                os.remove(error_file)
+        elif os.path.isfile(error_file):
+            os.replace(error_file, retry_file)
+        else:
+            return 0
+        file_dir = os.path.dirname(error_file)
+        count = 0
+        with open(retry_file, 'rb') as f:
+            for line in f:
+                line = line.decode('utf-8', 'ignore').strip()
+                if ':' not in line:
+                    continue
+                weibo_id, url = line.split(':', 1)
+                if '\t' in url:
+                    url, file_path = url.split('\t', 1)
+                else:
+                    # 旧格式没有记录文件路径
+                    file_name = url.split('?')[0].split('/')[-1]
+                    file_path = file_dir + os.sep + weibo_id + '_' + file_name
+                self.submit(url, file_path, error_file, weibo_id)
+                count += 1
+        # 仍失败的文件已由log_failure写入error_file
+        self.wait()
+        os.remove(retry_file)
+        return count
+
+    def wait(self):
+        """等待队列中的文件全部下载完成"""
+        with self.condition:
+            while self.pending:
+                self.condition.wait()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+        if self.progress is not None:
+            self.progress.close()
+            print(u'%d files downloaded, %d failed, %d MB' %
+                  (self.downloaded_count, self.failed_count,
+                   self.byte_count >> 20))
+
+
+def main():
+    """重新下载weibo-objectdata下所有not_downloaded.txt中的文件"""
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.split(
+        os.path.realpath(__file__))[0] + os.sep + 'weibo-objectdata'
+    downloader = MediaDownloader(HttpClient())
+    try:
+        for dir_path, dir_names, file_names in os.walk(root):
+            if ('not_downloaded.txt' in file_names
+                    or 'not_downloaded.txt.retry' in file_names):
+                error_file = dir_path + os.sep + 'not_downloaded.txt'
+                count = downloader.redownload(error_file)
+                print(u'%d files retried from %s' % (count, error_file))
+    finally:
+        downloader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""从user_data/data中的粉丝、评论数据构建关注关系图
+
+python follow_graph.py ingest [文件或目录 ...]
+python follow_graph.py info
+python follow_graph.py following <user_id>
+
+支持的格式：
+fans_p       ">>> id; 昵称"开头的块，">>>>>> Info:"中为所在地、性别、生日等，
+             ">>>>>> Fans:"中每行"id,昵称"为该用户关注的用户
+fans_info    以四个空格或tab分隔的行：Y/N、id、昵称、所在地、性别、生日，
+dicuss       最后为"[ id id ... ]"形式的关注列表，dicuss每行前面多一列时间
+fans         每行"id,昵称"，只有用户没有关注关系，fans.order同样如此
+
+图以CSR格式保存在graph目录中：ids.u64为升序的用户id，indptr.i64和
+indices.u32为每个用户关注的用户下标，属性为每个用户一个取值编号的
+<属性>.i32和取值列表<属性>.json，均用memmap读取。已导入的文件记录在
+meta.json中，再次ingest时只解析新增的文件并合并到已有的图中。
+"""
+
+import codecs
+import json
+import os
+import re
+import shutil
+import sys
+from array import array
+
+import numpy as np
+
+GRAPH_DIR = os.path.split(
+    os.path.realpath(__file__))[0] + os.sep + 'user_data' + os.sep + 'graph'
+DATA_DIR = os.path.split(
+    os.path.realpath(__file__))[0] + os.sep + 'user_data' + os.sep + 'data'
+ATTRIBUTES = ['name', 'location', 'gender', 'birthday']
+INFO_KEYS = {u'昵称': 'name', u'所在地': 'location', u'性别': 'gender',
+             u'生日': 'birthday'}
+MISSING = u'#'  # fans_info、dicuss中缺失的字段
+ID_PATTERN = re.compile(r'^\d{5,}$')
+FIELD_SEPARATOR = re.compile(r'\t| {4}')
+
+
+def sorted_unique(ids):
+    ids = np.sort(ids)
+    if len(ids):
+        ids = ids[np.concatenate(([True], ids[1:] != ids[:-1]))]
+    return ids
+
+
+def fix_name(name):
+    """部分文件中的昵称是GBK字节按latin-1解码后的乱码，还原为原昵称"""
+    try:
+        return name.encode('latin-1').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return name
+
+
+def last_unique(keys):
+    """keys中每个值最后一次出现的位置，用于后写入的属性覆盖先写入的"""
+    keys = keys[::-1]
+    unique, index = np.unique(keys, return_index=True)
+    return unique, len(keys) - 1 - index
+
+
+class GraphBuilder(object):
+    """逐行解析数据文件，把关注关系和用户属性暂存在紧凑数组中"""
+    def __init__(self):
+        self.src = array('Q')
+        self.dst = array('Q')
+        self.nodes = array('Q')
+        self.attributes = dict((name, (array('Q'), []))
+                               for name in ATTRIBUTES)
+
+    def add_node(self, user_id, **attributes):
+        user_id = int(user_id)
+        self.nodes.append(user_id)
+        for name, value in attributes.items():
+            if value and value != MISSING:
+                ids, values = self.attributes[name]
+                ids.append(user_id)
+                values.append(value)
+
+    def add_edges(self, user_id, following):
+        user_id = int(user_id)
+        for followed in following:
+            self.src.append(user_id)
+            self.dst.append(int(followed))
+
+    def parse_fans_p(self, f):
+        user_id = None
+        section = None
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.startswith('>>>>>> '):
+                section = line[7:].rstrip(':')
+            elif line.startswith('>>> '):
+                user_id, _, name = line[4:].partition('; ')
+                user_id = user_id.strip()
+                section = None
+                if ID_PATTERN.match(user_id):
+                    self.add_node(user_id, name=name.strip())
+                else:
+                    user_id = None
+            elif user_id and section == 'Info':
+                key, _, value = line.partition(u'：')
+                if key in INFO_KEYS:
+                    self.add_node(user_id, **{INFO_KEYS[key]: value.strip()})
+            elif user_id and section == 'Fans':
+                followed, _, name = line.partition(',')
+                if ID_PATTERN.match(followed):
+                    self.add_node(followed, name=name.strip())
+                    self.add_edges(user_id, [followed])
+
+    def parse_fans_info(self, f):
+        """fans_info和dicuss的行，id为第一个全是数字的字段"""
+        for line in f:
+            fields = FIELD_SEPARATOR.split(line.rstrip('\r\n'))
+            following = fields.pop() if fields[-1].startswith('[') else ''
+            for i, field in enumerate(fields):
+                if ID_PATTERN.match(field):
+                    break
+            else:
+                continue
+            info = (fields[i + 1:] + [''] * 4)[:4]
+            self.add_node(field, **dict(zip(ATTRIBUTES, info)))
+            following = [
+                followed for followed in following.strip('[] ').split()
+                if ID_PATTERN.match(followed)
+            ]
+            self.add_edges(field, following)
+
+    def parse_fans(self, f):
+        for line in f:
+            user_id, _, name = line.rstrip('\r\n').partition(',')
+            if ID_PATTERN.match(user_id):
+                self.add_node(user_id, name=fix_name(name.strip()))
+
+    def parse_file(self, file_path):
+        """按第一行的内容判断文件格式"""
+        with codecs.open(file_path, 'r', encoding='utf-8',
+                         errors='replace') as f:
+            first_line = f.readline()
+            f.seek(0)
+            if first_line.startswith('>>> '):
+                self.parse_fans_p(f)
+            elif FIELD_SEPARATOR.search(first_line):
+                self.parse_fans_info(f)
+            elif ',' in first_line:
+                self.parse_fans(f)
+            else:
+                return False
+        return True
+
+
+class FollowGraph(object):
+    """memmap读取的关注关系图，按用户id查询关注列表、入度和属性"""
+    def __init__(self, path=GRAPH_DIR):
+        self.path = path
+        meta_path = path + os.sep + 'meta.json'
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            self.ids = self.load('ids.u64', np.uint64)
+            self.indptr = self.load('indptr.i64', np.int64)
+            self.indices = self.load('indices.u32', np.uint32)
+        else:
+            self.meta = {'ingested': {}}
+            self.ids = np.array([], dtype=np.uint64)
+            self.indptr = np.zeros(1, dtype=np.int64)
+            self.indices = np.array([], dtype=np.uint32)
+        self.vocabularies = {}
+
+    def load(self, file_name, dtype):
+        file_path = self.path + os.sep + file_name
+        if not os.path.getsize(file_path):
+            return np.array([], dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def edge_count(self):
+        return len(self.indices)
+
+    def index(self, user_ids):
+        """用户id对应的下标，不在图中的为-1"""
+        user_ids = np.asarray(user_ids, dtype=np.uint64)
+        if not len(self.ids):
+            return np.full(len(user_ids), -1, dtype=np.int64)
+        index = np.searchsorted(self.ids, user_ids)
+        index[index == len(self.ids)] = 0
+        return np.where(self.ids[index] == user_ids, index, -1)
+
+    def following(self, user_id):
+        i = self.index([user_id])[0]
+        if i < 0:
+            return np.array([], dtype=np.uint64)
+        return self.ids[self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def in_degree(self):
+        return np.bincount(self.indices, minlength=len(self.ids))
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def pagerank(self, damping=0.85, iterations=30):
+        """幂迭代计算PageRank，没有关注任何人的用户的分数平均分给全部用户"""
+        n = len(self.ids)
+        if not n:
+            return np.array([])
+        out_degree = self.out_degree()
+        src = np.repeat(np.arange(n), out_degree)
+        rank = np.full(n, 1.0 / n)
+        for i in range(iterations):
+            share = np.where(out_degree > 0, rank / np.maximum(out_degree, 1),
+                             0)
+            dangling = rank[out_degree == 0].sum()
+            rank = (1 - damping + damping * dangling) / n + damping * np.bincount(
+                self.indices, weights=share[src], minlength=n)
+        return rank
+
+    def codes(self, name):
+        file_name = name + '.i32'
+        if not os.path.isfile(self.path + os.sep + file_name):
+            return np.full(len(self.ids), -1, dtype=np.int32)
+        return self.load(file_name, np.int32)
+
+    def vocabulary(self, name):
+        if name not in self.vocabularies:
+            file_path = self.path + os.sep + name + '.json'
+            vocabulary = []
+            if os.path.isfile(file_path):
+                with codecs.open(file_path, 'r', encoding='utf-8') as f:
+                    vocabulary = json.load(f)
+            self.vocabularies[name] = vocabulary
+        return self.vocabularies[name]
+
+    def attribute(self, user_id, name):
+        i = self.index([user_id])[0]
+        if i < 0:
+            return None
+        code = self.codes(name)[i]
+        return self.vocabulary(name)[code] if code >= 0 else None
+
+    def edge_ids(self):
+        """全部关注关系的(关注者id, 被关注者id)"""
+        src = np.repeat(self.ids, self.out_degree())
+        return src, self.ids[self.indices]
+
+    def merge(self, builder, ingested):
+        """与新解析的数据合并，写入新的graph目录后替换原目录"""
+        src, dst = self.edge_ids()
+        src = np.concatenate([src, np.frombuffer(builder.src, np.uint64)])
+        dst = np.concatenate([dst, np.frombuffer(builder.dst, np.uint64)])
+        attribute_ids = [
+            np.frombuffer(builder.attributes[name][0], np.uint64)
+            for name in ATTRIBUTES
+        ]
+        ids = sorted_unique(
+            np.concatenate([self.ids, src, dst,
+                            np.frombuffer(builder.nodes, np.uint64)] +
+                           attribute_ids))
+        n = len(ids)
+        # 用(关注者下标, 被关注者下标)组成的uint64排序去重
+        keys = sorted_unique(
+            np.searchsorted(ids, src).astype(np.uint64) << np.uint64(32)
+            | np.searchsorted(ids, dst).astype(np.uint64))
+        src_index = (keys >> np.uint64(32)).astype(np.int64)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src_index, minlength=n), out=indptr[1:])
+        indices = (keys & np.uint64(0xffffffff)).astype(np.uint32)
+
+        new_path = self.path + '.new'
+        if os.path.isdir(new_path):
+            shutil.rmtree(new_path)
+        os.makedirs(new_path)
+        ids.tofile(new_path + os.sep + 'ids.u64')
+        indptr.tofile(new_path + os.sep + 'indptr.i64')
+        indices.tofile(new_path + os.sep + 'indices.u32')
+        for name, new_ids in zip(ATTRIBUTES, attribute_ids):
+            vocabulary = list(self.vocabulary(name))
+            codes = np.full(n, -1, dtype=np.int32)
+            codes[np.searchsorted(ids, self.ids)] = self.codes(name)
+            values = builder.attributes[name][1]
+            if values:
+                lookup = dict((value, i) for i, value in enumerate(vocabulary))
+                value_codes = np.empty(len(values), dtype=np.int32)
+                for i, value in enumerate(values):
+                    code = lookup.get(value)
+                    if code is None:
+                        code = lookup[value] = len(vocabulary)
+                        vocabulary.append(value)
+                    value_codes[i] = code
+                unique, index = last_unique(new_ids)
+                codes[np.searchsorted(ids, unique)] = value_codes[index]
+            codes.tofile(new_path + os.sep + name + '.i32')
+            with codecs.open(new_path + os.sep + name + '.json',
+                             'w',
+                             encoding='utf-8') as f:
+                json.dump(vocabulary, f, ensure_ascii=False)
+        meta = {
+            'ingested': dict(self.meta['ingested'], **ingested),
+            'nodes': n,
+            'edges': len(indices)
+        }
+        with open(new_path + os.sep + 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        old_path = self.path + '.old'
+        if os.path.isdir(self.path):
+            os.replace(self.path, old_path)
+        os.replace(new_path, self.path)
+        if os.path.isdir(old_path):
+            shutil.rmtree(old_path)
+        return FollowGraph(self.path)
+
+
+def data_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, dir_names, file_names in os.walk(path):
+                dir_names[:] = sorted(dir_name for dir_name in dir_names
+                                      if not dir_name.startswith('.'))
+                for file_name in sorted(file_names):
+                    if file_name.endswith('.txt'):
+                        yield os.path.join(dir_path, file_name)
+        else:
+            yield path
+
+
+def ingest(graph, paths):
+    """解析尚未导入或导入后有变化的文件，并合并到图中"""
+    builder = GraphBuilder()
+    ingested = {}
+    for file_path in data_files(paths):
+        file_path = os.path.realpath(file_path)
+        stat = os.stat(file_path)
+        key = [stat.st_size, int(stat.st_mtime)]
+        if graph.meta['ingested'].get(file_path) == key:
+            continue
+        if builder.parse_file(file_path):
+            print(u'Parsed %s' % file_path)
+            ingested[file_path] = key
+    if not ingested:
+        return graph
+    return graph.merge(builder, ingested)
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ['ingest', 'info', 'following']:
+        sys.exit(u'usage: python follow_graph.py ingest [paths] | info | '
+                 u'following <user_id>')
+    graph = FollowGraph()
+    if sys.argv[1] == 'ingest':
+        graph = ingest(graph, sys.argv[2:] or [DATA_DIR])
+    if sys.argv[1] == 'following':
+        for user_id in graph.following(int(sys.argv[2])):
+            print(u'%d %s' % (user_id, graph.attribute(user_id, 'name') or ''))
+        return
+    print(u'%d users, %d follow relations' % (len(graph), graph.edge_count()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import heapq
+import math
+import threading
+from array import array
+
+import numpy as np
+
+from user_list import UserListLoader
+
+SIGNALS = ['in_degree', 'pagerank']
+
+
+def discovered_path(user_config_file_path):
+    """user_id_list文件对应的新发现用户文件路径"""
+    return user_config_file_path + '.discovered.txt'
+
+
+class CrawlFrontier(object):
+    """按优先级产出待爬取用户，代替按文件顺序爬取
+
+    初始优先级为关注关系图中的入度或PageRank(按平均值为1缩放)，不在图中的
+    用户为0，相同时按文件顺序。每爬完一个用户，按其followers_count给它关注
+    和转发过的用户加分，相当于一条带权重的入边，优先级用堆维护，旧的堆项在
+    取出时跳过。其中尚未出现过的用户加入待爬取队列，并追加到discovered文件，
+    重启后与原列表一起读取。已爬取的用户由进度数据库记录，重启后不再产出。
+    """
+    def __init__(self,
+                 user_loader,
+                 graph,
+                 since_date,
+                 signal='in_degree',
+                 discover=True,
+                 discovered_file=''):
+        self.user_loader = user_loader
+        self.graph = graph
+        self.since_date = since_date
+        self.discover = discover
+        self.discovered_file = discovered_file
+        self.lock = threading.Lock()
+        self.base = self.get_base(signal)
+        self.heap = []
+        self.priority = {}  # 待爬取用户的当前优先级
+        self.since_dates = {}  # since_date与默认值不同的待爬取用户
+        self.seen = set()
+        self.seq = 0
+        self.discovered_count = 0
+        self.boost_count = 0
+        loaders = [user_loader]
+        if discovered_file:
+            open(discovered_file, 'a').close()
+            loaders.append(
+                UserListLoader(discovered_file,
+                               since_date,
+                               user_loader.progress,
+                               offset=0,
+                               recrawl=user_loader.recrawl))
+        self.load(loaders)
+
+    def get_base(self, signal):
+        if not len(self.graph):
+            return np.array([])
+        if signal == 'pagerank':
+            return self.graph.pagerank() * len(self.graph)
+        return self.graph.in_degree().astype(np.float64)
+
+    def base_priority(self, user_ids):
+        index = self.graph.index(user_ids)
+        if not len(self.base):
+            return np.zeros(len(index))
+        return np.where(index >= 0, self.base[np.maximum(index, 0)], 0)
+
+    def load(self, loaders):
+        ids = array('Q')
+        for loader in loaders:
+            ids.extend(loader.pending_ids(self.since_dates))
+        ids = np.frombuffer(ids, dtype=np.uint64)
+        # 去掉重复的用户，保留第一次出现的位置
+        ids = ids[np.sort(np.unique(ids, return_index=True)[1])]
+        self.seen.update(ids.tolist())
+        priority = self.base_priority(ids)
+        self.priority = dict(zip(ids.tolist(), priority.tolist()))
+        self.heap = [(-p, i, user_id)
+                     for i, (user_id, p) in enumerate(self.priority.items())]
+        heapq.heapify(self.heap)
+        self.seq = len(self.heap)
+
+    def push(self, user_id, priority):
+        self.priority[user_id] = priority
+        heapq.heappush(self.heap, (-priority, self.seq, user_id))
+        self.seq += 1
+
+    def pop(self):
+        """取出优先级最高的用户，跳过优先级已更新的旧堆项"""
+        with self.lock:
+            while self.heap:
+                priority, i, user_id = heapq.heappop(self.heap)
+                if self.priority.get(user_id) == -priority:
+                    del self.priority[user_id]
+                    return user_id
+        return None
+
+    def __iter__(self):
+        while True:
+            user_id = self.pop()
+            if user_id is None:
+                return
+            yield {
+                'user_id': str(user_id),
+                'since_date': self.since_dates.pop(user_id, self.since_date),
+                'ifPass': False
+            }
+
+    def finish(self, user, retweeted_ids=()):
+        """用户爬取完成后给其关注和转发过的用户加分，并加入新发现的用户"""
+        weight = 1 + math.log10(1 + user.get('followers_count', 0))
+        targets = set(self.graph.following(int(user['id'])).tolist())
+        targets.update(int(user_id) for user_id in retweeted_ids if user_id)
+        new_ids = []
+        if self.discover:
+            for user_id in targets:
+                if user_id in self.seen:
+                    continue
+                # 进度数据库中已爬取过的用户不再加入
+                since_date = self.user_loader.get_since_date([str(user_id)])
+                if since_date:
+                    new_ids.append(user_id)
+                    if since_date != self.since_date:
+                        self.since_dates[user_id] = since_date
+        base = dict(zip(new_ids, self.base_priority(new_ids).tolist()))
+        lines = []
+        with self.lock:
+            for user_id in targets:
+                if user_id in self.priority:
+                    self.push(user_id, self.priority[user_id] + weight)
+                    self.boost_count += 1
+                elif user_id in base and user_id not in self.seen:
+                    self.seen.add(user_id)
+                    self.push(user_id, base[user_id] + weight)
+                    self.discovered_count += 1
+                    lines.append('%d\n' % user_id)
+            if lines and self.discovered_file:
+                with open(self.discovered_file, 'a') as f:
+                    f.writelines(lines)
+
+    def stats(self):
+        return {
+            'pending': len(self.priority),
+            'discovered': self.discovered_count,
+            'boosted': self.boost_count
+        }
+
+    def print_stats(self):
+        print(u'Frontier: %(pending)d pending, %(discovered)d discovered, '
+              u'%(boosted)d boosted' % self.stats())
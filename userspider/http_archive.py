@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+
+LIVE = 'live'
+RECORD = 'record'
+REPLAY = 'replay'
+HTTP_MODES = [LIVE, RECORD, REPLAY]
+
+
+def request_key(url, params=None):
+    """带参数的完整url，作为存档的索引"""
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+class ArchivedResponse(object):
+    """存档中的响应，提供get_json、get_long_weibo用到的属性"""
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpArchive(object):
+    """以url为索引、zlib压缩响应体的SQLite存档"""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS response (
+            url TEXT PRIMARY KEY,
+            status INTEGER NOT NULL,
+            body BLOB NOT NULL,
+            recorded_at REAL NOT NULL)""")
+
+    def save(self, key, status_code, content):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?)',
+                (key, status_code, zlib.compress(content), time.time()))
+
+    def load(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT status, body FROM response WHERE url = ?',
+                (key, )).fetchone()
+        if not row:
+            return None
+        return ArchivedResponse(row[0], zlib.decompress(row[1]))
+
+    def close(self):
+        self.connection.close()
+
+
+class RecordingClient(object):
+    """正常请求，同时把响应写入存档"""
+    def __init__(self, http, archive):
+        self.http = http
+        self.archive = archive
+
+    def get(self, url, params=None, **kwargs):
+        r = self.http.get(url, params=params, **kwargs)
+        self.archive.save(request_key(url, params), r.status_code, r.content)
+        return r
+
+
+class ReplayClient(object):
+    """只从存档返回响应，不访问网络；未存档的请求返回ok为0"""
+    def __init__(self, archive):
+        self.archive = archive
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def get(self, url, params=None, **kwargs):
+        r = self.archive.load(request_key(url, params))
+        if r is None:
+            self.miss_count += 1
+            return ArchivedResponse(404, b'{"ok": 0}')
+        self.hit_count += 1
+        return r
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpClient(object):
+    """整个爬虫共享的HTTP客户端，复用keep-alive连接"""
+    def __init__(self,
+                 pool_connections=10,
+                 pool_maxsize=10,
+                 pool_sizes=None,
+                 connect_timeout=5,
+                 read_timeout=10,
+                 max_retries=3):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        self.adapters = []
+        self.mount('https://', pool_connections, pool_maxsize, max_retries)
+        self.mount('http://', pool_connections, pool_maxsize, max_retries)
+        # 按主机单独设置连接池大小，如{"m.weibo.cn": 20}
+        for host, size in (pool_sizes or {}).items():
+            for scheme in ['https://', 'http://']:
+                self.mount(scheme + host, 1, size, max_retries)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+
+    def mount(self, prefix, pool_connections, pool_maxsize, max_retries):
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              max_retries=max_retries)
+        self.session.mount(prefix, adapter)
+        self.adapters.append(adapter)
+
+    def get(self, url, **kwargs):
+        """发送GET请求，未指定timeout时使用默认的连接/读取超时"""
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            r = self.session.get(url, **kwargs)
+        except Exception:
+            with self.lock:
+                self.error_count += 1
+            raise
+        with self.lock:
+            self.request_count += 1
+        return r
+
+    def stats(self):
+        """返回连接复用统计"""
+        connections = 0
+        pool_requests = 0
+        for adapter in self.adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    pool_requests += pool.num_requests
+        return {
+            'requests': self.request_count,
+            'errors': self.error_count,
+            'connections': connections,
+            'reused': max(pool_requests - connections, 0)
+        }
+
+    def print_stats(self):
+        print(u'HTTP: %(requests)d requests, %(errors)d errors, '
+              u'%(connections)d connections opened, '
+              u'%(reused)d reused' % self.stats())
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import codecs
+import json
+import os
+import sys
+from collections import OrderedDict
+
+
+class JsonlWriter(object):
+    """每条微博追加为一行json，同时追加记录"微博id 偏移量"索引
+
+    同一条微博再次写入时直接追加新行，索引中较后的偏移量覆盖之前的记录，
+    由compact()按首次出现的顺序合并为{user, weibo}格式。
+    """
+    def __init__(self, file_dir, user_id):
+        prefix = file_dir + os.sep + str(user_id)
+        self.data_path = prefix + '.jsonl'
+        self.index_path = prefix + '.jsonl.idx'
+        self.user_path = prefix + '.user.json'
+        self.json_path = prefix + '.json'
+
+    def write(self, user, weibo_list):
+        """追加写入微博，并覆盖保存用户信息"""
+        if user:
+            with codecs.open(self.user_path, 'w', encoding='utf-8') as f:
+                json.dump(user, f, ensure_ascii=False)
+        index_lines = []
+        with open(self.data_path, 'ab') as f:
+            for w in weibo_list:
+                offset = f.tell()
+                line = json.dumps(w, ensure_ascii=False) + '\n'
+                f.write(line.encode('utf-8'))
+                index_lines.append('%s %d\n' % (w['id'], offset))
+        with open(self.index_path, 'a') as f:
+            f.writelines(index_lines)
+
+    def load_index(self):
+        """读取索引，返回按首次出现顺序排列的id到最新偏移量的映射"""
+        index = OrderedDict()
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    info = line.split()
+                    if len(info) == 2:
+                        index[info[0]] = int(info[1])
+        # 补上写入数据后、写入索引前中断时缺失的行
+        last_offset = max(index.values()) if index else -1
+        with open(self.data_path, 'rb') as f:
+            if last_offset >= 0:
+                f.seek(last_offset)
+                f.readline()
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                index[str(json.loads(line.decode('utf-8'))['id'])] = offset
+        return index
+
+    def read(self):
+        """合并为write_json使用的{user, weibo}格式"""
+        data = {}
+        if os.path.isfile(self.user_path):
+            with codecs.open(self.user_path, 'r', encoding='utf-8') as f:
+                data['user'] = json.load(f)
+        weibo = []
+        with open(self.data_path, 'rb') as f:
+            for offset in self.load_index().values():
+                f.seek(offset)
+                weibo.append(
+                    json.loads(f.readline().decode('utf-8'),
+                               object_pairs_hook=OrderedDict))
+        data['weibo'] = weibo
+        return data
+
+    def compact(self):
+        """生成与json写入方式相同的<user_id>.json文件"""
+        data = self.read()
+        with codecs.open(self.json_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        return self.json_path
+
+
+def main():
+    """将weibo-objectdata下全部jsonl文件合并为json文件"""
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.split(
+        os.path.realpath(__file__))[0] + os.sep + 'weibo-objectdata'
+    for dir_path, dir_names, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.endswith('.jsonl'):
+                writer = JsonlWriter(dir_path, file_name[:-len('.jsonl')])
+                print(u'Compacted into %s' % writer.compact())
+
+
+if __name__ == '__main__':
+    main()
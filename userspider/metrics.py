@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import codecs
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+def timed(stage):
+    """统计方法耗时和异常数，所在对象需有metrics属性，未启用时直接调用"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return func(self, *args, **kwargs)
+            start = time.time()
+            try:
+                return func(self, *args, **kwargs)
+            except Exception:
+                metrics.error(stage)
+                raise
+            finally:
+                metrics.observe(stage, time.time() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class Stage(object):
+    __slots__ = ('bucket_counts', 'count', 'sum', 'errors', 'bytes', 'slept')
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.bytes = 0
+        self.slept = 0.0
+
+
+class Metrics(object):
+    """各阶段的耗时直方图、字节数和错误数
+
+    启用后可定期写入json统计文件，并在localhost上提供Prometheus格式的
+    /metrics接口。限速器等组件的统计通过add_collector以gauge形式导出。
+    """
+    def __init__(self,
+                 enabled=False,
+                 stats_file='',
+                 interval=10,
+                 port=0):
+        self.enabled = enabled
+        self.stats_file = stats_file
+        self.interval = interval
+        self.port = port
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.collectors = []
+        self.started_at = time.time()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.server = None
+
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages.setdefault(name, Stage())
+        return stage
+
+    def observe(self, name, seconds):
+        with self.lock:
+            stage = self.stage(name)
+            stage.count += 1
+            stage.sum += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stage.bucket_counts[i] += 1
+                    break
+
+    def error(self, name):
+        with self.lock:
+            self.stage(name).errors += 1
+
+    def add_bytes(self, name, count):
+        if self.enabled:
+            with self.lock:
+                self.stage(name).bytes += count
+
+    def add_sleep(self, name, seconds):
+        """限速器等待的时间，计入所在阶段"""
+        if self.enabled and seconds:
+            with self.lock:
+                self.stage(name).slept += seconds
+
+    def add_collector(self, name, collector):
+        """collector返回{指标名: 数值}，导出为name_指标名"""
+        self.collectors.append((name, collector))
+
+    def gauges(self):
+        gauges = {}
+        for name, collector in self.collectors:
+            for key, value in collector().items():
+                gauges[name + '_' + key] = value
+        return gauges
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                stages[name] = {
+                    'count': stage.count,
+                    'sum': stage.sum,
+                    'errors': stage.errors,
+                    'bytes': stage.bytes,
+                    'slept': stage.slept,
+                    'buckets': dict(
+                        zip([str(bound) for bound in BUCKETS],
+                            stage.bucket_counts))
+                }
+        return {
+            'time': time.time(),
+            'uptime': time.time() - self.started_at,
+            'stages': stages,
+            'gauges': self.gauges()
+        }
+
+    def prometheus(self):
+        """Prometheus文本格式"""
+        snapshot = self.snapshot()
+        lines = [
+            '# TYPE weibo_stage_seconds histogram',
+        ]
+        for name, stage in sorted(snapshot['stages'].items()):
+            cumulative = 0
+            for bound in BUCKETS:
+                cumulative += stage['buckets'][str(bound)]
+                lines.append('weibo_stage_seconds_bucket{stage="%s",le="%s"} %d'
+                             % (name, bound, cumulative))
+            lines.append('weibo_stage_seconds_bucket{stage="%s",le="+Inf"} %d'
+                         % (name, stage['count']))
+            lines.append('weibo_stage_seconds_sum{stage="%s"} %f' %
+                         (name, stage['sum']))
+            lines.append('weibo_stage_seconds_count{stage="%s"} %d' %
+                         (name, stage['count']))
+        lines.append('# TYPE weibo_stage_errors_total counter')
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append('weibo_stage_errors_total{stage="%s"} %d' %
+                         (name, stage['errors']))
+        lines.append('# TYPE weibo_stage_bytes_total counter')
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append('weibo_stage_bytes_total{stage="%s"} %d' %
+                         (name, stage['bytes']))
+        lines.append('# TYPE weibo_stage_sleep_seconds_total counter')
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append('weibo_stage_sleep_seconds_total{stage="%s"} %f' %
+                         (name, stage['slept']))
+        for name, value in sorted(snapshot['gauges'].items()):
+            lines.append('# TYPE weibo_%s gauge' % name)
+            lines.append('weibo_%s %f' % (name, value))
+        return '\n'.join(lines) + '\n'
+
+    def write_stats_file(self):
+        tmp_path = self.stats_file + '.tmp'
+        with codecs.open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.stats_file)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write_stats_file()
+
+    def start(self):
+        """启动定期写统计文件的线程和/metrics接口"""
+        if not self.enabled:
+            return
+        if self.stats_file:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        if self.port:
+            metrics = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def log_message(self, format, *args):
+                    pass
+
+                def do_GET(self):
+                    body = metrics.prometheus().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type',
+                                     'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.port),
+                                              MetricsHandler)
+            self.server.daemon_threads = True
+            thread = threading.Thread(target=self.server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+    def close(self):
+        if not self.enabled:
+            return
+        self.stopped.set()
+        if self.stats_file:
+            self.write_stats_file()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import sys
+import threading
+import time
+
+
+class MongoSink(object):
+    """进程内共享一个MongoClient，每次批量upsert写入"""
+    def __init__(self, db_config=''):
+        try:
+            import pymongo
+        except ImportError:
+            sys.exit(u'Pymongo REQUIRED')
+        from pymongo import MongoClient
+
+        self.pymongo = pymongo
+        if db_config:
+            self.client = MongoClient(db_config)
+        else:
+            self.client = MongoClient()
+        self.db = self.client['weibo']
+        self.indexed = set()
+        self.lock = threading.Lock()
+        self.doc_count = 0
+        self.byte_count = 0
+        self.elapsed = 0.0
+
+    def ensure_index(self, collection):
+        """首次写入某个集合时在id上建立唯一索引"""
+        with self.lock:
+            if collection in self.indexed:
+                return
+            self.db[collection].create_index('id', unique=True)
+            self.indexed.add(collection)
+
+    def upsert(self, collection, info_list):
+        """以id为键，一次无序bulk_write写入全部文档"""
+        if not info_list:
+            return
+        from bson import BSON
+        from pymongo import UpdateOne
+
+        try:
+            self.ensure_index(collection)
+            start = time.time()
+            # $set不会修改info本身，不需要为多种写入方式deepcopy
+            requests = [
+                UpdateOne({'id': info['id']}, {'$set': info}, upsert=True)
+                for info in info_list
+            ]
+            self.db[collection].bulk_write(requests, ordered=False)
+            elapsed = time.time() - start
+            byte_count = sum(len(BSON.encode(info)) for info in info_list)
+        except self.pymongo.errors.ServerSelectionTimeoutError as e:
+            # 在写入线程中sys.exit只会结束该线程，改为抛出异常由调用方处理
+            raise ConnectionError(u'MONGODB REQUIRED') from e
+        with self.lock:
+            self.doc_count += len(info_list)
+            self.byte_count += byte_count
+            self.elapsed += elapsed
+
+    def stats(self):
+        elapsed = self.elapsed or 1e-9
+        return {
+            'docs': self.doc_count,
+            'bytes': self.byte_count,
+            'docs_per_sec': self.doc_count / elapsed,
+            'bytes_per_sec': self.byte_count / elapsed
+        }
+
+    def print_stats(self):
+        print(u'MongoDB: %(docs)d documents, %(docs_per_sec).1f docs/s, '
+              u'%(bytes_per_sec).0f bytes/s' % self.stats())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+
+DEFAULT_DB_CONFIG = {
+    'host': 'localhost',
+    'port': 3306,
+    'user': 'root',
+    'password': '123456',
+    'charset': 'utf8mb4'
+}
+
+CREATE_DATABASE = """CREATE DATABASE IF NOT EXISTS weibo DEFAULT
+                  CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"""
+
+CREATE_USER_TABLE = """
+        CREATE TABLE IF NOT EXISTS user (
+        id varchar(20) NOT NULL,
+        screen_name varchar(30),
+        gender varchar(10),
+        statuses_count INT,
+        followers_count INT,
+        follow_count INT,
+        description varchar(140),
+        profile_url varchar(200),
+        profile_image_url varchar(200),
+        avatar_hd varchar(200),
+        urank INT,
+        mbrank INT,
+        verified BOOLEAN DEFAULT 0,
+        verified_type INT,
+        verified_reason varchar(140),
+        PRIMARY KEY (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+
+CREATE_WEIBO_TABLE = """
+        CREATE TABLE IF NOT EXISTS weibo (
+        id varchar(20) NOT NULL,
+        bid varchar(12) NOT NULL,
+        user_id varchar(20),
+        screen_name varchar(20),
+        text varchar(2000),
+        topics varchar(200),
+        at_users varchar(200),
+        pics varchar(1000),
+        video_url varchar(1000),
+        location varchar(100),
+        created_at DATETIME,
+        source varchar(30),
+        attitudes_count INT,
+        comments_count INT,
+        reposts_count INT,
+        retweet_id varchar(20),
+        PRIMARY KEY (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+
+
+class MySQLSink(object):
+    """MySQL写入端，每个进程只建一次库表，复用连接池并批量多行插入"""
+    def __init__(self, db_config=None, pool_size=4, batch_size=500):
+        try:
+            import pymysql
+        except ImportError:
+            sys.exit(u'Pymysql REQUIRED')
+        self.pymysql = pymysql
+        # 复制一份配置，不修改调用方传入的db_config
+        self.db_config = dict(db_config or DEFAULT_DB_CONFIG)
+        self.db_config.pop('db', None)
+        self.batch_size = batch_size
+        self.pool_size = pool_size
+        self.pool = queue.LifoQueue(pool_size)
+        self.created_count = 0
+        self.lock = threading.Lock()
+        self.schema_ready = False
+
+    def connect(self, **kwargs):
+        try:
+            return self.pymysql.connect(**dict(self.db_config, **kwargs))
+        except self.pymysql.OperationalError as e:
+            # 在写入线程中sys.exit只会结束该线程，改为抛出异常由调用方处理
+            raise ConnectionError(u'MYSQL DATABASE REQUIRED') from e
+
+    def setup_schema(self):
+        """建立weibo库及user、weibo表，每个进程只执行一次"""
+        with self.lock:
+            if self.schema_ready:
+                return
+            connection = self.connect()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(CREATE_DATABASE)
+                    cursor.execute('USE weibo')
+                    cursor.execute(CREATE_USER_TABLE)
+                    cursor.execute(CREATE_WEIBO_TABLE)
+            finally:
+                connection.close()
+            self.schema_ready = True
+
+    @contextmanager
+    def connection(self):
+        """从连接池取出连接，用完放回"""
+        self.setup_schema()
+        with self.lock:
+            create = self.pool.empty() and self.created_count < self.pool_size
+            if create:
+                self.created_count += 1
+        if create:
+            try:
+                connection = self.connect(db='weibo')
+            except Exception:
+                with self.lock:
+                    self.created_count -= 1
+                raise
+        else:
+            connection = self.pool.get()
+            connection.ping(reconnect=True)
+        try:
+            yield connection
+        finally:
+            self.pool.put(connection)
+
+    def insert(self, table, data_list):
+        """按batch_size拼成多行INSERT ... ON DUPLICATE KEY UPDATE写入"""
+        if not data_list:
+            return
+        keys = list(data_list[0].keys())
+        row = '(' + ', '.join(['%s'] * len(keys)) + ')'
+        update = ', '.join(
+            ['{key} = VALUES({key})'.format(key=key) for key in keys])
+        with self.connection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    for i in range(0, len(data_list), self.batch_size):
+                        batch = data_list[i:i + self.batch_size]
+                        sql = """INSERT INTO {table}({keys}) VALUES {rows}
+                                 ON DUPLICATE KEY UPDATE {update}""".format(
+                            table=table,
+                            keys=', '.join(keys),
+                            rows=', '.join([row] * len(batch)),
+                            update=update)
+                        args = [data.get(key) for data in batch for key in keys]
+                        cursor.execute(sql, args)
+                connection.commit()
+            except Exception:
+                # 抛出异常，后台写入时该用户记为写入失败，下次重新爬取
+                connection.rollback()
+                raise
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import codecs
+import os
+import sqlite3
+import sys
+import threading
+
+DONE = 'done'
+MISSING = 'missing'
+
+
+def progress_path(user_config_file_path):
+    """user_id_list文件对应的进度数据库路径"""
+    return user_config_file_path + '.progress.db'
+
+
+class CrawlProgress(object):
+    """用SQLite记录爬取进度，代替每爬完一个用户就重写整个user_id_list文件"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS progress (
+            user_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            screen_name TEXT,
+            crawled_date TEXT)""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS high_water (
+            user_id TEXT PRIMARY KEY,
+            weibo_id INTEGER NOT NULL,
+            created_at TEXT)""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS profile (
+            user_id TEXT PRIMARY KEY,
+            statuses_count INTEGER NOT NULL,
+            followers_count INTEGER NOT NULL,
+            crawled_at TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            since_date TEXT NOT NULL DEFAULT '')""")
+        columns = [
+            row[1] for row in self.connection.execute(
+                'PRAGMA table_info(profile)')
+        ]
+        if 'since_date' not in columns:
+            # 旧的快照没有since_date，为空时总是重新翻页
+            self.connection.execute(
+                "ALTER TABLE profile ADD COLUMN since_date TEXT NOT NULL "
+                "DEFAULT ''")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT)""")
+
+    def record(self, user_id, status, screen_name='', crawled_date=''):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?)',
+                (str(user_id), status, screen_name, crawled_date))
+
+    def get(self, user_id):
+        """返回(status, screen_name, crawled_date)，未爬取过返回None"""
+        with self.lock:
+            return self.connection.execute(
+                'SELECT status, screen_name, crawled_date FROM progress '
+                'WHERE user_id = ?', (str(user_id), )).fetchone()
+
+    def get_high_water(self, user_id):
+        """返回已保存的最新微博(weibo_id, created_at)，没有时返回None"""
+        with self.lock:
+            return self.connection.execute(
+                'SELECT weibo_id, created_at FROM high_water '
+                'WHERE user_id = ?', (str(user_id), )).fetchone()
+
+    def set_high_water(self, user_id, weibo_id, created_at):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO high_water VALUES (?, ?, ?)',
+                (str(user_id), weibo_id, created_at))
+
+    def get_profile(self, user_id):
+        """返回上次爬取时的(statuses_count, followers_count, crawled_at, digest,
+        since_date)，since_date为已爬取的微博最早的日期"""
+        with self.lock:
+            return self.connection.execute(
+                'SELECT statuses_count, followers_count, crawled_at, digest, '
+                'since_date FROM profile WHERE user_id = ?',
+                (str(user_id), )).fetchone()
+
+    def set_profile(self, user_id, statuses_count, followers_count,
+                    crawled_at, digest, since_date):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO profile (user_id, statuses_count, '
+                'followers_count, crawled_at, digest, since_date) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (str(user_id), statuses_count, followers_count, crawled_at,
+                 digest, since_date))
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM meta WHERE key = ?', (key, )).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+    def all(self):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT user_id, status, screen_name, crawled_date '
+                'FROM progress').fetchall()
+        return dict((row[0], row[1:]) for row in rows)
+
+    def export(self, user_config_file_path, out_path=None):
+        """将进度写回"id 昵称 日期"格式的文本，不存在的用户会被删除"""
+        out_path = out_path or user_config_file_path
+        progress = self.all()
+        tmp_path = out_path + '.tmp'
+        with open(user_config_file_path, 'rb') as f, codecs.open(
+                tmp_path, 'w', encoding='utf-8') as out:
+            lines = []
+            for line in f.read().splitlines():
+                line = line.decode('utf-8-sig')
+                info = line.split(' ')
+                if len(info) > 0 and info[0] in progress:
+                    status, screen_name, crawled_date = progress[info[0]]
+                    if status == MISSING:
+                        continue
+                    if len(info) == 1:
+                        info.append(screen_name or 'non_screen_name')
+                    if len(info) == 2:
+                        info.append(crawled_date)
+                    else:
+                        info[2] = crawled_date
+                    line = ' '.join(info)
+                lines.append(line)
+            out.write('\n'.join(lines))
+        os.replace(tmp_path, out_path)
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    """python progress.py export <user_id_list文件> [输出文件]"""
+    if len(sys.argv) < 3 or sys.argv[1] != 'export':
+        sys.exit(u'usage: python progress.py export user_id_list.txt [out.txt]')
+    user_config_file_path = os.path.realpath(sys.argv[2])
+    out_path = sys.argv[3] if len(sys.argv) > 3 else None
+    path = progress_path(user_config_file_path)
+    if not os.path.isfile(path):
+        sys.exit(u'%s non-exists' % path)
+    progress = CrawlProgress(path)
+    progress.export(user_config_file_path, out_path)
+    progress.close()
+    print(u'Progress exported to %s' % (out_path or user_config_file_path))
+
+
+if __name__ == '__main__':
+    main()
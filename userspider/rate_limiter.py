@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import threading
+import time
+
+# 微博限流时返回的HTTP状态码
+THROTTLE_STATUS = (403, 418)
+
+
+class ThrottledError(Exception):
+    """同一请求重试max_retries次后仍被限制"""
+
+
+class AdaptiveRateLimiter(object):
+    """令牌桶限速器，按AIMD调整速率：请求正常时加性增加，被限制时乘性减少"""
+    def __init__(self,
+                 rate=0.5,
+                 min_rate=0.05,
+                 max_rate=5.0,
+                 burst=5,
+                 increase=0.05,
+                 decrease=0.5,
+                 max_retries=5,
+                 enabled=True):
+        self.enabled = enabled  # 为False时不限速，用于离线回放
+        self.rate = float(rate)  # 当前速率，单位为请求数/秒
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.burst = float(burst)
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.max_retries = max_retries  # 被限制的请求等待后重试的次数
+        self.tokens = self.burst
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+        self.slept = 0.0
+        self.success_count = 0
+        self.throttle_count = 0
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """取得一个令牌，令牌不足时等待"""
+        if not self.enabled:
+            return 0
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+            self.slept += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def success(self):
+        with self.lock:
+            self.success_count += 1
+            self.refill()
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttle(self):
+        """被限制时降低速率并清空令牌，下一个请求至少等待1/rate秒"""
+        with self.lock:
+            self.throttle_count += 1
+            self.refill()
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0)
+
+    def observe(self, ok):
+        if ok:
+            self.success()
+        else:
+            self.throttle()
+
+    def stats(self):
+        return {
+            'rate': self.rate,
+            'slept': self.slept,
+            'success': self.success_count,
+            'throttled': self.throttle_count
+        }
+
+    def print_stats(self):
+        print(u'Rate: %(rate).2f req/s, slept %(slept).1fs, '
+              u'%(success)d ok, %(throttled)d throttled' % self.stats())
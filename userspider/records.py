@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+from collections.abc import MutableMapping
+from operator import attrgetter
+
+# parse_weibo写入的字段，retweet为被转发的微博，只有转发微博才有
+WEIBO_FIELDS = ('user_id', 'screen_name', 'id', 'bid', 'text', 'pics',
+                'video_url', 'location', 'created_at', 'source',
+                'attitudes_count', 'comments_count', 'reposts_count', 'topics',
+                'at_users', 'retweet')
+
+MISSING = object()
+
+USER_FIELDS = ('id', 'screen_name', 'gender', 'statuses_count',
+               'followers_count', 'follow_count', 'description', 'profile_url',
+               'profile_image_url', 'avatar_hd', 'urank', 'mbrank', 'verified',
+               'verified_type', 'verified_reason')
+
+
+class Record(MutableMapping):
+    """用__slots__保存字段的记录，支持dict的读写方式
+
+    没有赋值的字段视为不存在，迭代顺序为固定的字段顺序，即parse_weibo
+    原来写入OrderedDict的顺序。写入文件或数据库时用to_dict()转为dict。
+    """
+    __slots__ = ()
+    FIELDS = ()
+    OPTIONAL_FIELDS = ()  # 可能没有赋值的字段，需放在FIELDS末尾
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_SET = frozenset(cls.FIELDS)
+        cls.COMMON_FIELDS = tuple(key for key in cls.FIELDS
+                                  if key not in cls.OPTIONAL_FIELDS)
+        # 一次取出全部常规字段的值，比逐个getattr快
+        cls.get_common = staticmethod(attrgetter(*cls.COMMON_FIELDS))
+
+    def __init__(self, *args, **kwargs):
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key not in self.FIELD_SET:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELD_SET:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self.FIELD_SET:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.FIELD_SET and hasattr(self, key)
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if hasattr(self, key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_dict())
+
+    def __copy__(self):
+        return self.copy()
+
+    def copy(self):
+        """浅拷贝，列表等字段值与原记录共享"""
+        record = type(self)()
+        for key in self.FIELDS:
+            try:
+                setattr(record, key, getattr(self, key))
+            except AttributeError:
+                pass
+        return record
+
+    def to_dict(self):
+        """转为普通dict，嵌套的记录同样转换"""
+        try:
+            data = dict(zip(self.COMMON_FIELDS, self.get_common(self)))
+            keys = self.OPTIONAL_FIELDS
+        except AttributeError:
+            data = {}
+            keys = self.FIELDS
+        for key in keys:
+            value = getattr(self, key, MISSING)
+            if value is MISSING:
+                continue
+            if isinstance(value, Record):
+                value = value.to_dict()
+            data[key] = value
+        return data
+
+    def to_tuple(self):
+        """按字段顺序的值，没有赋值的字段为None"""
+        try:
+            values = self.get_common(self)
+        except AttributeError:
+            return tuple(getattr(self, key, None) for key in self.FIELDS)
+        return values + tuple(
+            getattr(self, key, None) for key in self.OPTIONAL_FIELDS)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data)
+
+
+class WeiboRecord(Record):
+    __slots__ = WEIBO_FIELDS
+    FIELDS = WEIBO_FIELDS
+    OPTIONAL_FIELDS = ('retweet', )
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(data)
+        if isinstance(data.get('retweet'), dict):
+            record.retweet = cls(data['retweet'])
+        return record
+
+    def csv_row(self, with_retweet=True):
+        """write_csv的一行：去掉user_id、screen_name，转发时接上原微博的全部字段"""
+        row = list(self.get_common(self)[2:])
+        if with_retweet:
+            retweet = getattr(self, 'retweet', None)
+            if retweet:
+                row.append(False)
+                row.extend(retweet.get_common(retweet))
+            else:
+                row.append(True)
+        return row
+
+
+class UserRecord(Record):
+    __slots__ = USER_FIELDS
+    FIELDS = USER_FIELDS
@@ -1,24 +1,42 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 
+import asyncio
 import codecs
 import copy
 import csv
+import hashlib
 import json
 import math
 import os
-import random
 import sys
+import threading
 import traceback
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
-from time import sleep
 
-import requests
-from lxml import etree
-from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
+from coordinator import LeaseCoordinator, coordinator_path
+from downloader import MediaDownloader
+from follow_graph import GRAPH_DIR, FollowGraph
+from frontier import SIGNALS, CrawlFrontier, discovered_path
+from http_archive import (HTTP_MODES, LIVE, REPLAY, RECORD, HttpArchive,
+                          RecordingClient, ReplayClient)
+from http_client import HttpClient
+from jsonl_writer import JsonlWriter
+from metrics import Metrics, timed
+from mongo_sink import MongoSink
+from mysql_sink import MySQLSink
+from progress import DONE, MISSING, CrawlProgress, progress_path
+from user_list import UserListLoader
+from weibo_parser import parse_text
+from write_behind import WriteBehind
+from rate_limiter import THROTTLE_STATUS, AdaptiveRateLimiter, ThrottledError
+from records import UserRecord, WeiboRecord
+from status_cache import COUNT_FIELDS, StatusCache
+
 
 class Weibo(object):
     def __init__(self, config):
@@ -42,15 +60,71 @@ class Weibo(object):
         self.cookie = {'Cookie': config.get('cookie')} 
         self.db_config = config['db_config']  
         self.print_debug = config['print_debug']
+        self.metrics = Metrics(**config.get('metrics', {}))
+        self.http = HttpClient(**config.get('http', {}))
+        self.http_mode = config.get('http_mode', LIVE)
+        self.api_base = config.get('api_base', 'https://m.weibo.cn')
+        self.api = self.get_api_client(config)
+        self.limiter = AdaptiveRateLimiter(enabled=self.http_mode != REPLAY,
+                                           **config.get('rate_limit', {}))
+        cache_config = dict(config.get('status_cache', {}))
+        cache_path = cache_config.pop(
+            'path',
+            os.path.split(os.path.realpath(__file__))[0] + os.sep +
+            'status_cache.db')
+        if self.http_mode != LIVE:
+            # 录制时每个长微博、被转发微博都要请求并存档，回放时重新解析全部微博，
+            # 均不使用已缓存的解析结果
+            cache_path = ':memory:'
+        if self.http_mode == REPLAY:
+            self.original_pic_download = 0
+            self.retweet_pic_download = 0
+            self.original_video_download = 0
+            self.retweet_video_download = 0
+        self.status_cache = StatusCache(cache_path,
+                                        enabled=self.http_mode == LIVE,
+                                        **cache_config)
+        self.long_text_executor = ThreadPoolExecutor(
+            max_workers=config.get('long_text_workers', 4))
+        self.downloader = MediaDownloader(self.http,
+                                          self.cookie,
+                                          metrics=self.metrics,
+                                          **config.get('download', {}))
+        if 'mongo' in self.write_mode:
+            self.mongo = MongoSink(self.db_config)
+            self.metrics.add_collector('mongo', self.mongo.stats)
+        if 'mysql' in self.write_mode:
+            self.mysql = MySQLSink(self.db_config or None,
+                                   **config.get('mysql', {}))
+        self.start_offset = config.get('start_offset')
+        self.resume_after = config.get('resume_after', '')
+        self.recrawl = config.get('recrawl', 0)
+        # statuses_count未变且上次翻页在该天数内的用户不再翻页，为0时总是翻页
+        self.skip_unchanged_days = config.get('skip_unchanged_days', 30)
+        self.coordinator = None  # 多进程共同爬取同一列表时认领用户
+        self.frontier = None  # 按关注关系图的优先级爬取
         user_id_list = config['user_id_list']
         if not isinstance(user_id_list, list):
             if not os.path.isabs(user_id_list):
                 user_id_list = os.path.split(
                     os.path.realpath(__file__))[0] + os.sep + user_id_list
             self.user_config_file_path = user_id_list 
+            if self.http_mode == REPLAY:
+                # 回放不读取也不记录爬取进度
+                self.progress = None
+            else:
+                self.progress = CrawlProgress(progress_path(user_id_list))
             user_config_list = self.get_user_config_list(user_id_list)
+            if 'coordinator' in config and self.http_mode != REPLAY:
+                user_config_list = self.get_coordinator(
+                    user_id_list, config['coordinator'])
+            if 'frontier' in config:
+                user_config_list = self.get_frontier(user_id_list,
+                                                     config['frontier'])
         else:
             self.user_config_file_path = ''
+            self.progress = None
+            self.user_loader = None
             user_config_list = [{
                 'user_id': user_id,
                 'since_date': self.since_date
@@ -61,8 +135,26 @@ class Weibo(object):
         self.start_date = '' 
         self.user = {}  
         self.got_count = 0  
-        self.weibo = []  
-        self.weibo_id_list = [] 
+        self.weibo = []  # 尚未写入的微博，每次写入后清空
+        self.flush_size = config.get('flush_size', 200)  # 缓存的微博达到该数量时写入
+        # 后台写入队列中每种写入方式最多缓存的批次数，为0时在爬取线程中同步写入
+        write_queue_size = config.get('write_queue_size', 4)
+        self.sinks = WriteBehind(
+            self.get_sinks(), write_queue_size) if write_queue_size else None
+        self.weibo_ids = set()
+        self.retweeted_ids = set()  # 被转发微博的作者，加入frontier
+        self.profile = None  # 上次爬取时的用户信息快照
+        self.user_digest = ''
+        self.crawled_at = ''  # 最近一次翻页的时间
+        self.high_water = None  # 上次爬取时已保存的最新微博(weibo_id, created_at)
+        self.newest_weibo = None  # 本次爬到的最新微博(weibo_id, created_at)
+        self.inflight = None  # 全局在途请求上限，由AsyncWeibo设置
+        self.metrics.add_collector('limiter', self.limiter.stats)
+        self.metrics.add_collector('http', self.http.stats)
+        self.metrics.add_collector('status_cache', self.status_cache.stats)
+        if self.frontier:
+            self.metrics.add_collector('frontier', self.frontier.stats)
+        self.metrics.start()
 
     def validate_config(self, config):
         """验证配置是否正确"""
@@ -82,7 +174,7 @@ class Weibo(object):
             sys.exit(u'since_date should be yyyy-mm-dd or integer')
 
         # 验证write_mode
-        write_mode = ['csv', 'json', 'mongo', 'mysql']
+        write_mode = ['csv', 'json', 'jsonl', 'mongo', 'mysql']
         if not isinstance(config['write_mode'], list):
             sys.exit(u'write_mode should be list')
         for mode in config['write_mode']:
@@ -103,6 +195,83 @@ class Weibo(object):
             if not os.path.isfile(user_id_list):
                 sys.exit(u'%s non-exists' % user_id_list)
 
+        # 验证http
+        if not isinstance(config.get('http', {}), dict):
+            sys.exit(u'http should be dict')
+
+        # 验证http_mode
+        if config.get('http_mode', LIVE) not in HTTP_MODES:
+            sys.exit(u'http_mode should be one of %s' % ', '.join(HTTP_MODES))
+
+        # 验证rate_limit
+        if not isinstance(config.get('rate_limit', {}), dict):
+            sys.exit(u'rate_limit should be dict')
+
+        # 验证download
+        if not isinstance(config.get('download', {}), dict):
+            sys.exit(u'download should be dict')
+
+        # 验证metrics
+        if not isinstance(config.get('metrics', {}), dict):
+            sys.exit(u'metrics should be dict')
+
+        # 验证coordinator
+        if 'coordinator' in config:
+            if not isinstance(config['coordinator'], dict):
+                sys.exit(u'coordinator should be dict')
+            if isinstance(config['user_id_list'], list):
+                sys.exit(u'coordinator requires user_id_list file path')
+
+        # 验证frontier
+        if 'frontier' in config:
+            if not isinstance(config['frontier'], dict):
+                sys.exit(u'frontier should be dict')
+            if isinstance(config['user_id_list'], list):
+                sys.exit(u'frontier requires user_id_list file path')
+            if 'coordinator' in config:
+                sys.exit(u'frontier and coordinator cannot be used together')
+            if config['frontier'].get('signal', 'in_degree') not in SIGNALS:
+                sys.exit(u'frontier signal should be one of %s' %
+                         ', '.join(SIGNALS))
+
+        # 验证mysql
+        if not isinstance(config.get('mysql', {}), dict):
+            sys.exit(u'mysql should be dict')
+
+        # 验证recrawl
+        if config.get('recrawl', 0) not in [0, 1]:
+            sys.exit(u'recrawl should be 0 or 1')
+
+        # 验证skip_unchanged_days
+        skip_unchanged_days = config.get('skip_unchanged_days', 30)
+        if not isinstance(skip_unchanged_days,
+                          int) or skip_unchanged_days < 0:
+            sys.exit(u'skip_unchanged_days should be non-negative integer')
+
+        # 验证start_offset
+        start_offset = config.get('start_offset')
+        if start_offset is not None and (not isinstance(start_offset, int)
+                                         or start_offset < 0):
+            sys.exit(u'start_offset should be non-negative integer')
+
+        # 验证write_queue_size
+        write_queue_size = config.get('write_queue_size', 4)
+        if not isinstance(write_queue_size, int) or write_queue_size < 0:
+            sys.exit(u'write_queue_size should be non-negative integer')
+
+        # 验证status_cache
+        if not isinstance(config.get('status_cache', {}), dict):
+            sys.exit(u'status_cache should be dict')
+
+        # 验证concurrency、max_inflight、long_text_workers、flush_size
+        for argument in [
+                'concurrency', 'max_inflight', 'long_text_workers',
+                'flush_size'
+        ]:
+            value = config.get(argument, 1)
+            if not isinstance(value, int) or value < 1:
+                sys.exit(u'%s should be positive integer' % argument)
+
     def is_date(self, since_date):
         """判断日期格式是否正确"""
         try:
@@ -111,62 +280,87 @@ class Weibo(object):
         except ValueError:
             return False
 
-    def get_json(self, params):
-        """获取网页中json数据"""
-        url = 'https://m.weibo.cn/api/container/getIndex?'
-        r = requests.get(url, params=params, cookies=self.cookie)
-        return r.json()
+    def get_api_client(self, config):
+        """根据http_mode返回请求getIndex和detail页面的客户端"""
+        if self.http_mode == LIVE:
+            return self.http
+        archive_path = config.get(
+            'http_archive',
+            os.path.split(os.path.realpath(__file__))[0] + os.sep +
+            'http_archive.db')
+        self.archive = HttpArchive(archive_path)
+        if self.http_mode == RECORD:
+            return RecordingClient(self.http, self.archive)
+        return ReplayClient(self.archive)
+
+    def get(self, url, **kwargs):
+        """发送GET请求，并发爬取时受全局在途请求数限制"""
+        if self.inflight is None:
+            return self.api.get(url, cookies=self.cookie, **kwargs)
+        with self.inflight:
+            return self.api.get(url, cookies=self.cookie, **kwargs)
+
+    @timed('get_json')
+    def get_json(self, params, retry_empty=False):
+        """获取网页中json数据
+
+        retry_empty为True时ok为0或cards为空的响应同样视为被限制，重试后仍为空时
+        返回最后一次的响应，由调用方判断用户不存在还是仍被限制。
+        """
+        url = self.api_base + '/api/container/getIndex?'
+        js = None
+        for i in range(self.limiter.max_retries + 1):
+            self.metrics.add_sleep('get_json', self.limiter.acquire())
+            r = self.get(url, params=params)
+            self.metrics.add_bytes('get_json', len(r.content))
+            if r.status_code in THROTTLE_STATUS:
+                # 被限制时降低速率，等待后重试同一请求
+                self.limiter.throttle()
+                js = None
+                continue
+            js = r.json()
+            if retry_empty and not self.has_data(js):
+                # 被限制时也可能返回HTTP 200和ok为0
+                self.limiter.throttle()
+                continue
+            self.limiter.success()
+            return js
+        if js is not None:
+            return js
+        raise ThrottledError(u'%s%s throttled %d times' %
+                             (url, params, self.limiter.max_retries + 1))
+
+    def has_data(self, js):
+        """ok为1且微博列表的cards不为空"""
+        if not js.get('ok'):
+            return False
+        data = js.get('data') or {}
+        return 'cards' not in data or bool(data['cards'])
 
     def get_weibo_json(self, page):
-        """获取网页中微博json数据"""
+        """获取网页中微博json数据，statuses_count以内的页面不应为空"""
         params = {
             'containerid': '107603' + str(self.user_config['user_id']),
             'page': page
         }
-        js = self.get_json(params)
+        js = self.get_json(params, retry_empty=True)
+        if not self.has_data(js):
+            raise ThrottledError(u'page %d of %s empty %d times' %
+                                 (page, self.user_config['user_id'],
+                                  self.limiter.max_retries + 1))
         return js
 
+    @timed('user_to_mongodb')
     def user_to_mongodb(self):
         """将爬取的用户信息写入MongoDB数据库"""
-        user_list = [self.user]
+        user_list = [self.user.to_dict()]
         self.info_to_mongodb('user', user_list)
         print(u'%s inserted to database' % self.user['screen_name'])
 
+    @timed('user_to_mysql')
     def user_to_mysql(self):
         """将爬取的用户信息写入MySQL数据库"""
-        db_config = {
-            'host': 'localhost',
-            'port': 3306,
-            'user': 'root',
-            'password': '123456',
-            'charset': 'utf8mb4'
-        }
-        # 创建'weibo'数据库
-        create_database = """CREATE DATABASE IF NOT EXISTS weibo DEFAULT
-                         CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"""
-        self.mysql_create_database(db_config, create_database)
-        # 创建'user'表
-        create_table = """
-                CREATE TABLE IF NOT EXISTS user (
-                id varchar(20) NOT NULL,
-                screen_name varchar(30),
-                gender varchar(10),
-                statuses_count INT,
-                followers_count INT,
-                follow_count INT,
-                description varchar(140),
-                profile_url varchar(200),
-                profile_image_url varchar(200),
-                avatar_hd varchar(200),
-                urank INT,
-                mbrank INT,
-                verified BOOLEAN DEFAULT 0,
-                verified_type INT,
-                verified_reason varchar(140),
-                PRIMARY KEY (id)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
-        self.mysql_create_table(db_config, create_table)
-        self.mysql_insert(db_config, 'user', [self.user])
+        self.mysql.insert('user', [self.user.to_dict()])
         print(u'%s inserted to database' % self.user['screen_name'])
 
     def user_to_database(self):
@@ -179,10 +373,11 @@ class Weibo(object):
     def get_user_info(self):
         """获取用户信息"""
         params = {'containerid': '100505' + str(self.user_config['user_id'])}
-        js = self.get_json(params)
+        # 重试后仍返回ok为0才认为用户不存在
+        js = self.get_json(params, retry_empty=True)
         if js['ok']:
             info = js['data']['userInfo']
-            user_info = {}
+            user_info = UserRecord()
             user_info['id'] = self.user_config['user_id']
             user_info['screen_name'] = info.get('screen_name', '')
             user_info['gender'] = info.get('gender', '')
@@ -200,7 +395,12 @@ class Weibo(object):
             user_info['verified_reason'] = info.get('verified_reason', '')
             user = self.standardize_info(user_info)
             self.user = user
-            self.user_to_database()
+            self.user_digest = self.get_user_digest()
+            if self.progress:
+                self.profile = self.progress.get_profile(user['id'])
+            # 与上次爬取时相同的用户信息不再写入数据库
+            if not (self.profile and self.profile[3] == self.user_digest):
+                self.user_to_database()
             self.user_exists = True
             return user
         else:
@@ -208,11 +408,48 @@ class Weibo(object):
             self.user_exists = False
             return False
 
+    def get_user_digest(self):
+        """用户信息的摘要，包含write_mode，新增写入方式后会重新写入user"""
+        data = json.dumps([sorted(self.write_mode),
+                           self.user.to_dict()],
+                          sort_keys=True)
+        return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+    def extends_since_date(self):
+        """以早于已爬取范围的since_date重新加入的用户，需要翻页获取之前的微博"""
+        return bool(self.profile and self.profile[4]
+                    and self.user_config['since_date'] < self.profile[4])
+
+    def is_unchanged(self):
+        """statuses_count与上次爬取时相同、上次翻页未超过skip_unchanged_days天，
+        且已爬取的微博覆盖了本次的since_date"""
+        if not (self.profile and self.profile[4] and self.skip_unchanged_days):
+            return False
+        if self.extends_since_date():
+            return False
+        crawled_at = datetime.strptime(self.profile[2], '%Y-%m-%d %H:%M:%S')
+        return (self.profile[0] == self.user['statuses_count']
+                and datetime.now() - crawled_at < timedelta(
+                    self.skip_unchanged_days))
+
+    @timed('get_long_weibo')
     def get_long_weibo(self, id):
-        """获取长微博"""
+        """获取长微博，计数字段未过期的缓存直接返回"""
+        weibo, fresh = self.status_cache.get(id)
+        if weibo and fresh:
+            return weibo
         for i in range(5):
-            url = 'https://m.weibo.cn/detail/%s' % id
-            html = requests.get(url, cookies=self.cookie).text
+            url = self.api_base + '/detail/%s' % id
+            self.metrics.add_sleep('get_long_weibo', self.limiter.acquire())
+            r = self.get(url)
+            self.metrics.add_bytes('get_long_weibo', len(r.content))
+            if r.status_code == 404:
+                # 微博已删除或回放时不在存档中，不再重试，保留截断的内容
+                return None
+            if r.status_code in THROTTLE_STATUS:
+                self.limiter.throttle()
+                continue
+            html = r.text
             html = html[html.find('"status":'):]
             html = html[:html.rfind('"hotScheme"')]
             html = html[:html.rfind(',')]
@@ -220,9 +457,12 @@ class Weibo(object):
             js = json.loads(html, strict=False)
             weibo_info = js.get('status')
             if weibo_info:
+                self.limiter.success()
                 weibo = self.parse_weibo(weibo_info)
+                self.status_cache.put(weibo)
                 return weibo
-            sleep(random.randint(6, 10))
+            # 未取到长微博时降低速率，下次重试由限速器控制等待时间
+            self.limiter.throttle()
 
     def get_pics(self, weibo_info):
         """获取微博原始图片url"""
@@ -270,23 +510,11 @@ class Weibo(object):
             video_url_list += live_photo_list
         return ';'.join(video_url_list)
 
+    @timed('download_one_file')
     def download_one_file(self, url, file_path, type, weibo_id):
-        """下载单个文件(图片/视频)"""
-        try:
-            if not os.path.isfile(file_path):
-                s = requests.Session()
-                s.mount(url, HTTPAdapter(max_retries=5))
-                downloaded = s.get(url, cookies=self.cookie, timeout=(5, 10))
-                with open(file_path, 'wb') as f:
-                    f.write(downloaded.content)
-        except Exception as e:
-            error_file = self.get_filepath(
-                type) + os.sep + 'not_downloaded.txt'
-            with open(error_file, 'ab') as f:
-                url = str(weibo_id) + ':' + url + '\n'
-                f.write(url.encode(sys.stdout.encoding))
-            print('Error: ', e)
-            traceback.print_exc()
+        """将单个文件(图片/视频)加入下载队列"""
+        error_file = self.get_filepath(type) + os.sep + 'not_downloaded.txt'
+        self.downloader.submit(url, file_path, error_file, weibo_id)
 
     def handle_download(self, file_type, file_dir, urls, w):
         """处理下载相关操作"""
@@ -336,12 +564,12 @@ class Weibo(object):
                 describe = u'OriginalContent' + describe
             else:
                 describe = u'Retweet' + describe
-            print(u'Ready to download %s' % describe)
+            print(u'Ready to queue %s' % describe)
             file_dir = self.get_filepath(file_type)
             file_dir = file_dir + os.sep + describe
             if not os.path.isdir(file_dir):
                 os.makedirs(file_dir)
-            for w in tqdm(self.weibo[wrote_count:], desc='Download progress'):
+            for w in self.weibo:
                 if weibo_type == 'retweet':
                     if w.get('retweet'):
                         w = w['retweet']
@@ -349,7 +577,7 @@ class Weibo(object):
                         continue
                 if w.get(key):
                     self.handle_download(file_type, file_dir, w.get(key), w)
-            print(u'%s downloaded to:' % describe)
+            print(u'%s queued for download to:' % describe)
             print(file_dir)
         except Exception as e:
             print('Error: ', e)
@@ -425,15 +653,14 @@ class Weibo(object):
     def standardize_info(self, weibo):
         """标准化信息，去除乱码"""
         for k, v in weibo.items():
-            if 'bool' not in str(type(v)) and 'int' not in str(
-                    type(v)) and 'list' not in str(
-                        type(v)) and 'long' not in str(type(v)):
+            if isinstance(v, str):
                 weibo[k] = v.replace(u"\u200b", "").encode(
                     sys.stdout.encoding, "ignore").decode(sys.stdout.encoding)
         return weibo
 
+    @timed('parse_weibo')
     def parse_weibo(self, weibo_info):
-        weibo = OrderedDict()
+        weibo = WeiboRecord()
         if weibo_info['user']:
             weibo['user_id'] = weibo_info['user']['id']
             weibo['screen_name'] = weibo_info['user']['screen_name']
@@ -442,12 +669,11 @@ class Weibo(object):
             weibo['screen_name'] = ''
         weibo['id'] = int(weibo_info['id'])
         weibo['bid'] = weibo_info['bid']
-        text_body = weibo_info['text']
-        selector = etree.HTML(text_body)
-        weibo['text'] = etree.HTML(text_body).xpath('string(.)')
+        text, location, topics, at_users = parse_text(weibo_info['text'])
+        weibo['text'] = text
         weibo['pics'] = self.get_pics(weibo_info)
         weibo['video_url'] = self.get_video_url(weibo_info)
-        weibo['location'] = self.get_location(selector)
+        weibo['location'] = location
         weibo['created_at'] = weibo_info['created_at']
         weibo['source'] = weibo_info['source']
         weibo['attitudes_count'] = self.string_to_int(
@@ -456,8 +682,8 @@ class Weibo(object):
             weibo_info.get('comments_count', 0))
         weibo['reposts_count'] = self.string_to_int(
             weibo_info.get('reposts_count', 0))
-        weibo['topics'] = self.get_topics(selector)
-        weibo['at_users'] = self.get_at_users(selector)
+        weibo['topics'] = topics
+        weibo['at_users'] = at_users
         return self.standardize_info(weibo)
 
     def print_user_info(self):
@@ -504,36 +730,16 @@ class Weibo(object):
         print('-' * 120)
 
     def get_one_weibo(self, info):
+        """解析卡片中的微博，长微博先使用截断的内容，保留后再由get_long_text获取全文"""
         try:
             weibo_info = info['mblog']
-            weibo_id = weibo_info['id']
             retweeted_status = weibo_info.get('retweeted_status')
-            is_long = weibo_info.get('isLongText')
+            weibo = self.parse_weibo(weibo_info)
             if retweeted_status:  # 转发
-                retweet_id = retweeted_status.get('id')
-                is_long_retweet = retweeted_status.get('isLongText')
-                if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
-                    if not weibo:
-                        weibo = self.parse_weibo(weibo_info)
-                else:
-                    weibo = self.parse_weibo(weibo_info)
-                if is_long_retweet:
-                    retweet = self.get_long_weibo(retweet_id)
-                    if not retweet:
-                        retweet = self.parse_weibo(retweeted_status)
-                else:
-                    retweet = self.parse_weibo(retweeted_status)
+                retweet = self.get_retweet(retweeted_status)
                 retweet['created_at'] = self.standardize_date(
                     retweeted_status['created_at'])
                 weibo['retweet'] = retweet
-            else:  # 原创
-                if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
-                    if not weibo:
-                        weibo = self.parse_weibo(weibo_info)
-                else:
-                    weibo = self.parse_weibo(weibo_info)
             weibo['created_at'] = self.standardize_date(
                 weibo_info['created_at'])
             return weibo
@@ -541,6 +747,63 @@ class Weibo(object):
             print("Error: ", e)
             traceback.print_exc()
 
+    def get_retweet(self, retweeted_status):
+        """被转发的微博优先使用未过期的缓存，计数字段取自卡片中的最新值
+
+        过期的缓存与get_long_weibo一样重新获取，卡片中已有完整内容，
+        重新解析后写回缓存；长微博的全文由get_long_weibo刷新。
+        """
+        retweet, fresh = self.status_cache.get(retweeted_status['id'])
+        if retweet and fresh:
+            for key in COUNT_FIELDS:
+                retweet[key] = self.string_to_int(
+                    retweeted_status.get(key, 0))
+        else:
+            retweet = self.parse_weibo(retweeted_status)
+            if not retweeted_status.get('isLongText'):
+                # 长微博的截断内容不缓存，全文由get_long_weibo缓存
+                self.status_cache.put(retweet)
+        return retweet
+
+    def is_long_text(self, info):
+        weibo_info = info['mblog']
+        retweeted_status = weibo_info.get('retweeted_status') or {}
+        return bool(
+            weibo_info.get('isLongText') or retweeted_status.get('isLongText'))
+
+    def get_long_text(self, info, weibo):
+        """获取长微博全文，替换卡片中截断的内容，获取失败时保留截断的内容"""
+        try:
+            weibo_info = info['mblog']
+            retweeted_status = weibo_info.get('retweeted_status')
+            if weibo_info.get('isLongText'):
+                long_weibo = self.get_long_weibo(weibo_info['id'])
+                if long_weibo:
+                    long_weibo['created_at'] = weibo['created_at']
+                    if 'retweet' in weibo:
+                        long_weibo['retweet'] = weibo['retweet']
+                    weibo = long_weibo
+            if retweeted_status and retweeted_status.get('isLongText'):
+                retweet = self.get_long_weibo(retweeted_status.get('id'))
+                if retweet:
+                    retweet['created_at'] = weibo['retweet']['created_at']
+                    weibo['retweet'] = retweet
+        except Exception as e:
+            print("Error: ", e)
+            traceback.print_exc()
+        return weibo
+
+    def fill_long_text(self, page_weibo):
+        """并发获取一页中保留下来的长微博全文"""
+        futures = [
+            self.long_text_executor.submit(self.get_long_text, w, wb)
+            if self.is_long_text(w) else None for w, wb in page_weibo
+        ]
+        return [
+            future.result() if future else wb
+            for future, (w, wb) in zip(futures, page_weibo)
+        ]
+
     def is_pinned_weibo(self, info):
         weibo_info = info['mblog']
         title = weibo_info.get('title')
@@ -552,14 +815,23 @@ class Weibo(object):
     def get_one_page(self, page):
         try:
             js = self.get_weibo_json(page)
+            is_end = False
+            page_weibo = []
             if js['ok']:
                 weibos = js['data']['cards']
                 for w in weibos:
                     if w['card_type'] == 9:
                         wb = self.get_one_weibo(w)
                         if wb:
-                            if wb['id'] in self.weibo_id_list:
+                            if wb['id'] in self.weibo_ids:
                                 continue
+                            if self.high_water and wb['id'] <= self.high_water[0]:
+                                # 已爬取过的内容，置顶微博除外
+                                if self.is_pinned_weibo(w):
+                                    continue
+                                print(u'Reached stored weibo of {}({}) at the {} page'.format(self.user['screen_name'], self.user['id'], page))
+                                is_end = True
+                                break
                             created_at = datetime.strptime(
                                 wb['created_at'], '%Y-%m-%d')
                             since_date = datetime.strptime(
@@ -568,16 +840,28 @@ class Weibo(object):
                                 if self.is_pinned_weibo(w):
                                     continue
                                 else:
-                                    print(u'Already got {}({}) the {} pages'.format(self.user['screen_name'],self.user['id'], page))
-                                    return True
+                                    is_end = True
+                                    break
+                            if self.frontier and 'retweet' in wb:
+                                self.retweeted_ids.add(
+                                    wb['retweet']['user_id'])
                             if (not self.filter) or (
                                     'retweet' not in wb.keys()):
-                                self.weibo.append(wb)
-                                self.weibo_id_list.append(wb['id'])
-                                self.got_count += 1
-                                if self.print_debug == 1:
-                                    self.print_weibo(wb)
+                                page_weibo.append((w, wb))
+                                self.weibo_ids.add(wb['id'])
+                            if not self.newest_weibo or wb['id'] > self.newest_weibo[0]:
+                                self.newest_weibo = (wb['id'], wb['created_at'])
+            # 只为保留下来的微博获取长微博全文
+            for wb in self.fill_long_text(page_weibo):
+                self.weibo.append(wb)
+                self.got_count += 1
+                if self.print_debug == 1:
+                    self.print_weibo(wb)
             print(u'Already got {}({}) the {} pages'.format(self.user['screen_name'],self.user['id'], page))
+            return is_end
+        except ThrottledError:
+            # 被限制而缺页的用户不能记为已爬取
+            raise
         except Exception as e:
             print("Error: ", e)
             traceback.print_exc()
@@ -591,25 +875,8 @@ class Weibo(object):
             print('user non exits')
 
     def get_write_info(self, wrote_count):
-        write_info = []
-        for w in self.weibo[wrote_count:]:
-            wb = OrderedDict()
-            for k, v in w.items():
-                if k not in ['user_id', 'screen_name', 'retweet']:
-                    if 'unicode' in str(type(v)):
-                        v = v.encode('utf-8')
-                    wb[k] = v
-            if not self.filter:
-                if w.get('retweet'):
-                    wb['is_original'] = False
-                    for k2, v2 in w['retweet'].items():
-                        if 'unicode' in str(type(v2)):
-                            v2 = v2.encode('utf-8')
-                        wb['retweet_' + k2] = v2
-                else:
-                    wb['is_original'] = True
-            write_info.append(wb)
-        return write_info
+        """csv的数据行，顺序与get_result_headers对应"""
+        return [w.csv_row(not self.filter) for w in self.weibo]
 
     def get_filepath(self, type):
         try:
@@ -640,31 +907,33 @@ class Weibo(object):
             result_headers = result_headers + result_headers2 + result_headers3
         return result_headers
 
+    @timed('write_csv')
     def write_csv(self, wrote_count):
         write_info = self.get_write_info(wrote_count)
         result_headers = self.get_result_headers()
-        result_data = [w.values() for w in write_info]
+        result_data = write_info
+        path = self.get_filepath('csv')
+        # 重新爬取的用户追加到已有文件，只在新文件中写入表头
+        is_new = not os.path.isfile(path) or os.path.getsize(path) == 0
         if sys.version < '3':  # python2.x
-            with open(self.get_filepath('csv'), 'ab') as f:
-                f.write(codecs.BOM_UTF8)
+            with open(path, 'ab') as f:
+                if is_new:
+                    f.write(codecs.BOM_UTF8)
                 writer = csv.writer(f)
-                if wrote_count == 0:
+                if is_new:
                     writer.writerows([result_headers])
                 writer.writerows(result_data)
         else:  # python3.x
-            with open(self.get_filepath('csv'),
-                      'a',
-                      encoding='utf-8-sig',
-                      newline='') as f:
+            with open(path, 'a', encoding='utf-8-sig', newline='') as f:
                 writer = csv.writer(f)
-                if wrote_count == 0:
+                if is_new:
                     writer.writerows([result_headers])
                 writer.writerows(result_data)
         print(u'%d content inserted into csv:' % self.got_count)
-        print(self.get_filepath('csv'))
+        print(path)
 
     def update_json_data(self, data, weibo_info):
-        data['user'] = self.user
+        data['user'] = self.user.to_dict()
         if data.get('weibo'):
             is_new = 1  # 待写入微博是否全部为新微博，即待写入微博与json中的数据不重复
             for old in data['weibo']:
@@ -687,266 +956,241 @@ class Weibo(object):
             data['weibo'] = weibo_info
         return data
 
+    @timed('write_json')
     def write_json(self, wrote_count):
         data = {}
         path = self.get_filepath('json')
         if os.path.isfile(path):
             with codecs.open(path, 'r', encoding="utf-8") as f:
                 data = json.load(f)
-        weibo_info = self.weibo[wrote_count:]
+        weibo_info = [w.to_dict() for w in self.weibo]
         data = self.update_json_data(data, weibo_info)
         with codecs.open(path, 'w', encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False)
         print(u'%d content inserted into json file:' % self.got_count)
         print(path)
 
-    def info_to_mongodb(self,collection, info_list):
-        try:
-            import pymongo
-        except ImportError:
-            sys.exit(u'Pymongo REQUIRED')
-        try:
-            from pymongo import MongoClient
+    @timed('write_jsonl')
+    def write_jsonl(self, wrote_count):
+        """将微博逐行追加到jsonl文件，不重写已有内容"""
+        path = self.get_filepath('jsonl')
+        writer = JsonlWriter(os.path.dirname(path), self.user_config['user_id'])
+        writer.write(self.user.to_dict(), [w.to_dict() for w in self.weibo])
+        print(u'%d content appended into jsonl file:' % self.got_count)
+        print(path)
 
-            if self.db_config:
-                client = MongoClient(self.db_config)
-            else:
-                client = MongoClient()
-            db = client['weibo']
-            collection = db[collection]
-            if len(self.write_mode) > 1:
-                new_info_list = copy.deepcopy(info_list)
-            else:
-                new_info_list = info_list
-            for info in new_info_list:
-                if not collection.find_one({'id': info['id']}):
-                    collection.insert_one(info)
-                else:
-                    collection.update_one({'id': info['id']}, {'$set': info})
-        except pymongo.errors.ServerSelectionTimeoutError:
-            sys.exit(u'MONGODB REQUIRED')
+    def info_to_mongodb(self, collection, info_list):
+        self.mongo.upsert(collection, info_list)
 
+    @timed('weibo_to_mongodb')
     def weibo_to_mongodb(self, wrote_count):
-        self.info_to_mongodb('weibo', self.weibo[wrote_count:])
+        self.info_to_mongodb('weibo', [w.to_dict() for w in self.weibo])
         print(u'%d content inserted into mongodb' % self.got_count)
+        self.mongo.print_stats()
 
-    def mysql_create(self, connection, sql):
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
-        finally:
-            connection.close()
-
-    def mysql_create_database(self, db_config, sql):
-        try:
-            import pymysql
-        except ImportError:
-            sys.exit(u'Pymongo REQUIRED')
-        try:
-            if self.db_config:
-                db_config = self.db_config
-            connection = pymysql.connect(**db_config)
-            self.mysql_create(connection, sql)
-        except pymysql.OperationalError:
-            sys.exit(u'MYSQL DATABASE REQUIRED')
-
-    def mysql_create_table(self, db_config, sql):
-        import pymysql
-
-        if self.db_config:
-            db_config = self.db_config
-        db_config['db'] = 'weibo'
-        connection = pymysql.connect(**db_config)
-        self.mysql_create(connection, sql)
-
-    def mysql_insert(self, db_config, table, data_list):
-        import pymysql
-
-        if len(data_list) > 0:
-            keys = ', '.join(data_list[0].keys())
-            values = ', '.join(['%s'] * len(data_list[0]))
-            if self.db_config:
-                db_config = self.db_config
-            db_config['db'] = 'weibo'
-            connection = pymysql.connect(**db_config)
-            cursor = connection.cursor()
-            sql = """INSERT INTO {table}({keys}) VALUES ({values}) ON
-                     DUPLICATE KEY UPDATE""".format(table=table,
-                                                    keys=keys,
-                                                    values=values)
-            update = ','.join([
-                " {key} = values({key})".format(key=key)
-                for key in data_list[0]
-            ])
-            sql += update
-            try:
-                cursor.executemany(
-                    sql, [tuple(data.values()) for data in data_list])
-                connection.commit()
-            except Exception as e:
-                connection.rollback()
-                print('Error: ', e)
-                traceback.print_exc()
-            finally:
-                connection.close()
-
+    @timed('weibo_to_mysql')
     def weibo_to_mysql(self, wrote_count):
-        db_config = {
-            'host': 'localhost',
-            'port': 3306,
-            'user': 'root',
-            'password': '123456',
-            'charset': 'utf8mb4'
-        }
-        # 创建'weibo'表
-        create_table = """
-                CREATE TABLE IF NOT EXISTS weibo (
-                id varchar(20) NOT NULL,
-                bid varchar(12) NOT NULL,
-                user_id varchar(20),
-                screen_name varchar(20),
-                text varchar(2000),
-                topics varchar(200),
-                at_users varchar(200),
-                pics varchar(1000),
-                video_url varchar(1000),
-                location varchar(100),
-                created_at DATETIME,
-                source varchar(30),
-                attitudes_count INT,
-                comments_count INT,
-                reposts_count INT,
-                retweet_id varchar(20),
-                PRIMARY KEY (id)
-                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
-        self.mysql_create_table(db_config, create_table)
         weibo_list = []
         retweet_list = []
-        if len(self.write_mode) > 1:
-            info_list = copy.deepcopy(self.weibo[wrote_count:])
-        else:
-            info_list = self.weibo[wrote_count:]
-        for w in info_list:
-            if 'retweet' in w:
-                w['retweet']['retweet_id'] = ''
-                retweet_list.append(w['retweet'])
-                w['retweet_id'] = w['retweet']['id']
-                del w['retweet']
+        for w in self.weibo:
+            wb = w.to_dict()
+            retweet = wb.pop('retweet', None)
+            if retweet:
+                retweet['retweet_id'] = ''
+                retweet_list.append(retweet)
+                wb['retweet_id'] = retweet['id']
             else:
-                w['retweet_id'] = ''
-            weibo_list.append(w)
+                wb['retweet_id'] = ''
+            weibo_list.append(wb)
         # 在'weibo'表中插入或更新微博数据
-        self.mysql_insert(db_config, 'weibo', retweet_list)
-        self.mysql_insert(db_config, 'weibo', weibo_list)
+        self.mysql.insert('weibo', retweet_list + weibo_list)
         print(u'%d content inserted into mysql' % self.got_count)
 
-    def update_user_config_file(self, user_config_file_path):
-        print("Updating user config file")
-        with open(user_config_file_path, 'rb') as f:
-            try:
-                lines = f.read().splitlines()
-                lines = [line.decode('utf-8-sig') for line in lines]
-            except UnicodeDecodeError:
-                sys.exit(u'%s uft-8 format needed' %
-                         user_config_file_path)
-            for i, line in enumerate(lines):
-                info = line.split(' ')
-                if len(info) > 0 and info[0].isdigit():
-                    if self.user_config['user_id'] == info[0]:
-                        if self.user_exists:
-                            # if user exists and user_id is verified
-                            # update the line of user id
-                            if len(info) == 1:
-                                if self.user['screen_name']: 
-                                    info.append(self.user['screen_name'])
-                                else:
-                                    info.append("non_screen_name")
-                                info.append(self.start_date)
-                            if len(info) == 2:
-                                info.append(self.start_date)
-                            if len(info) > 2:
-                                info[2] = self.start_date
-                            lines[i] = ' '.join(info)
-                            break
-                        else:
-                            # if user is not exists or user_id is not verified
-                            # remove the line of user_id
-                            lines = lines[:i] + lines[i+1:]
-                            break
-        with codecs.open(user_config_file_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
+    def record_progress(self):
+        """在进度数据库中记录当前用户的爬取结果"""
+        user_id = self.user_config['user_id']
+        if self.user_exists:
+            screen_name = self.user.get('screen_name') or 'non_screen_name'
+            self.progress.record(user_id, DONE, screen_name, self.start_date)
+        else:
+            self.progress.record(user_id, MISSING)
+
+    def download_media(self, wrote_count):
+        """将微博中的图片、视频加入下载队列"""
+        if self.original_pic_download:
+            self.download_files('img', 'original', wrote_count)
+        if self.original_video_download:
+            self.download_files('video', 'original', wrote_count)
+        if not self.filter:
+            if self.retweet_pic_download:
+                self.download_files('img', 'retweet', wrote_count)
+            if self.retweet_video_download:
+                self.download_files('video', 'retweet', wrote_count)
+
+    def get_sinks(self):
+        """按write_mode返回各写入方式，参数为(爬虫快照, wrote_count)"""
+        sinks = OrderedDict()
+        if 'csv' in self.write_mode:
+            sinks['csv'] = Weibo.write_csv
+        if 'json' in self.write_mode:
+            sinks['json'] = Weibo.write_json
+        if 'jsonl' in self.write_mode:
+            sinks['jsonl'] = Weibo.write_jsonl
+        if 'mysql' in self.write_mode:
+            sinks['mysql'] = Weibo.weibo_to_mysql
+        if 'mongo' in self.write_mode:
+            sinks['mongo'] = Weibo.weibo_to_mongodb
+        if (self.original_pic_download or self.original_video_download
+                or self.retweet_pic_download or self.retweet_video_download):
+            sinks['download'] = Weibo.download_media
+        return sinks
 
     def write_data(self, wrote_count):
         """将爬到的信息写入文件或数据库"""
         if self.got_count > wrote_count:
-            if 'csv' in self.write_mode:
-                self.write_csv(wrote_count)
-            if 'json' in self.write_mode:
-                self.write_json(wrote_count)
-            if 'mysql' in self.write_mode:
-                self.weibo_to_mysql(wrote_count)
-            if 'mongo' in self.write_mode:
-                self.weibo_to_mongodb(wrote_count)
-            if self.original_pic_download:
-                self.download_files('img', 'original', wrote_count)
-            if self.original_video_download:
-                self.download_files('video', 'original', wrote_count)
-            if not self.filter:
-                if self.retweet_pic_download:
-                    self.download_files('img', 'retweet', wrote_count)
-                if self.retweet_video_download:
-                    self.download_files('video', 'retweet', wrote_count)
+            if self.sinks:
+                # 快照与当前爬虫共享用户信息和这批微博，之后self.weibo重新赋值，
+                # 快照中的列表不再修改，各写入线程无需deepcopy
+                self.sinks.submit(self.user_config['user_id'], copy.copy(self),
+                                  wrote_count)
+            else:
+                for write in self.get_sinks().values():
+                    write(self, wrote_count)
+            # 写入后释放，内存占用只与两次写入之间的微博数有关
+            self.weibo = []
 
     def get_pages(self):
         """获取全部微博"""
         if self.get_user_info():
-            page_count = self.get_page_count()
-            wrote_count = 0
-            if self.print_debug == 1:
-                self.print_user_info()
-            page1 = 0
-            random_pages = random.randint(1, 5)
-            self.start_date = datetime.now().strftime('%Y-%m-%d')
-            for page in tqdm(range(1, page_count + 1), desc='Progress'):
-                is_end = self.get_one_page(page)
-                if is_end:
-                    break
-
-                if page % 20 == 0: 
-                    self.write_data(wrote_count)
-                    wrote_count = self.got_count
-
-                # 通过加入随机等待避免被限制。爬虫速度过快容易被系统限制(一段时间后限
-                # 制会自动解除)，加入随机等待模拟人的操作，可降低被系统限制的风险。
-                if (page - page1) % random_pages == 0 and page < page_count:
-                    sleep(random.randint(10, 14))
-                    page1 = page
-                    random_pages = random.randint(1, 5)
-
-            self.write_data(wrote_count)  
-            print(u'Spider Done，get total %d weibo content' % self.got_count)
+            if self.is_unchanged():
+                # 上次爬取后没有新微博，只请求了用户信息，爬取日期保持不变
+                print(u'%s unchanged since %s, skip paging' %
+                      (self.user['screen_name'], self.profile[2]))
+                self.start_date = self.user_config['since_date']
+                self.crawled_at = self.profile[2]
+            else:
+                self.get_timeline()
+            if self.frontier:
+                self.frontier.finish(self.user, self.retweeted_ids)
         return False
 
+    def get_timeline(self):
+        """翻页获取微博，直到since_date或上次爬取到的最新微博"""
+        page_count = self.get_page_count()
+        wrote_count = 0
+        if self.print_debug == 1:
+            self.print_user_info()
+        self.start_date = datetime.now().strftime('%Y-%m-%d')
+        self.crawled_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if self.progress and not self.extends_since_date():
+            self.high_water = self.progress.get_high_water(
+                self.user_config['user_id'])
+        for page in tqdm(range(1, page_count + 1), desc='Progress'):
+            is_end = self.get_one_page(page)
+            if is_end:
+                break
+
+            if page % 20 == 0 or len(self.weibo) >= self.flush_size:
+                self.write_data(wrote_count)
+                wrote_count = self.got_count
+
+        self.write_data(wrote_count)  
+        print(u'Spider Done，get total %d weibo content' % self.got_count)
+        self.limiter.print_stats()
+
+    def finish_user(self, next_offset=None, wait=False):
+        """当前用户的微博全部写入后保存最新微博和爬取进度
+
+        后台写入时在写入线程中执行，wait为True时等待执行完成。
+        next_offset为续爬位置，并发爬取时由AsyncWeibo保存。
+        """
+        user = copy.copy(self)
+        if not self.sinks:
+            user.save_progress(next_offset)
+            return
+        done = threading.Event()
+
+        def callback():
+            try:
+                user.save_progress(next_offset)
+            finally:
+                done.set()
+
+        self.sinks.after(callback)
+        if wait:
+            done.wait()
+
+    def save_progress(self, next_offset=None):
+        user_id = self.user_config['user_id']
+        if self.sinks and self.sinks.pop_failed(user_id):
+            # 写入失败的用户不记录进度，下次重新爬取
+            print(u'Failed to write user %s, progress not saved' % user_id)
+            if self.coordinator:
+                self.coordinator.release(user_id, False)
+            return
+        self.save_high_water()
+        if self.progress:
+            self.record_progress()
+            self.save_profile()
+        if self.coordinator:
+            self.coordinator.release(user_id)
+        elif self.progress and next_offset is not None and self.can_resume():
+            self.user_loader.set_marker(next_offset)
+
+    def can_resume(self):
+        """有写入失败时不再推进续爬位置，重启后从失败的用户之前开始读取"""
+        return not (self.sinks and self.sinks.error_count)
+
+    def save_profile(self):
+        """全部写入后保存用户信息快照，下次爬取时据此判断是否需要翻页和写入user"""
+        if self.user_exists and self.crawled_at:
+            # 增量爬取与之前的爬取相接，已爬取的范围从两者中较早的since_date开始
+            since_date = self.user_config['since_date']
+            if self.profile and self.profile[4]:
+                since_date = min(since_date, self.profile[4])
+            self.progress.set_profile(self.user['id'],
+                                      self.user['statuses_count'],
+                                      self.user['followers_count'],
+                                      self.crawled_at, self.user_digest,
+                                      since_date)
+
+    def save_high_water(self):
+        """全部写入后保存最新微博，下次爬取到该微博即停止翻页"""
+        if self.progress and self.newest_weibo and (
+                not self.high_water
+                or self.newest_weibo[0] > self.high_water[0]):
+            self.progress.set_high_water(self.user_config['user_id'],
+                                         *self.newest_weibo)
+
     def get_user_config_list(self, file_path):
-        """获取文件中的微博id信息"""
-        with open(file_path, 'rb') as f:
-            lines = f.read().splitlines()
-            lines = [line.decode('utf-8-sig') for line in lines]
-            user_config_list = []
-            for line in lines:
-                info = line.split(' ')
-                if len(info) > 0 and info[0].isdigit():
-                    user_config = {}
-                    user_config['user_id'] = info[0]
-                    if len(info) > 2 and self.is_date(info[2]):
-                        user_config['since_date'] = info[2]
-                        # add pass tag to skip the finished content
-                        user_config['ifPass'] = True
-                    else:
-                        user_config['since_date'] = self.since_date
-                        user_config['ifPass'] = False
-                    user_config_list.append(user_config)
-        return user_config_list
+        """获取文件中待爬取的用户，按需逐行读取"""
+        self.user_loader = UserListLoader(file_path, self.since_date,
+                                          self.progress, self.start_offset,
+                                          self.resume_after, self.recrawl)
+        return self.user_loader
+
+    def get_coordinator(self, file_path, coordinator_config):
+        """多进程爬取时从任务数据库认领用户，首次使用时写入列表中的待爬取用户"""
+        coordinator_config = dict(coordinator_config)
+        path = coordinator_config.pop('path', '') or coordinator_path(file_path)
+        self.coordinator = LeaseCoordinator(path, **coordinator_config)
+        self.coordinator.seed(self.user_loader)
+        return self.coordinator
+
+    def get_frontier(self, file_path, frontier_config):
+        """按关注关系图中的入度或PageRank排序待爬取用户，爬取中发现的用户加入队列"""
+        self.frontier = CrawlFrontier(
+            self.user_loader,
+            FollowGraph(frontier_config.get('graph', '') or GRAPH_DIR),
+            self.since_date,
+            signal=frontier_config.get('signal', 'in_degree'),
+            discover=frontier_config.get('discover', 1),
+            discovered_file=discovered_path(file_path))
+        return self.frontier
+
+    def resumes_by_offset(self):
+        """按文件顺序爬取时才保存续爬位置，coordinator和frontier都会改变顺序"""
+        return self.user_config_list is self.user_loader
 
     def initialize_info(self, user_config):
         """初始化爬虫信息"""
@@ -954,30 +1198,164 @@ class Weibo(object):
         self.user = {}
         self.user_config = user_config
         self.got_count = 0
-        self.weibo_id_list = []
+        self.weibo_ids = set()
+        self.retweeted_ids = set()
+        self.profile = None
+        self.user_digest = ''
+        self.crawled_at = ''
+        self.high_water = None
+        self.newest_weibo = None
 
     def start(self):
         """运行爬虫"""
         try:
+            resume = True
             for index, user_config in enumerate(self.user_config_list):
-                if user_config['ifPass']:
+                if user_config.get('ifPass'):
                     # This will skip the user scripted before
                     continue
-                if index%10 == 0:
-                    print("pasue for ip checking")
-                    sleep(random.randint(6, 10))
                 print("spidering user", user_config['user_id'])
                 self.initialize_info(user_config)
-                if self.get_pages():
-                    print(u'Finished this task')
-                    print('*' * 100)
-                if self.user_config_file_path:
-                    self.update_user_config_file(self.user_config_file_path)
-                else:
+                try:
+                    if self.get_pages():
+                        print(u'Finished this task')
+                        print('*' * 100)
+                except Exception as e:
+                    # 被限制、超时等出错的用户不记录进度，之后也不再推进续爬位置，
+                    # 下次从该用户重新爬取
+                    print('Error: ', e)
+                    if not isinstance(e, ThrottledError):
+                        traceback.print_exc()
+                    resume = False
+                    if self.coordinator:
+                        self.coordinator.release(user_config['user_id'], False)
+                    continue
+                self.finish_user(
+                    user_config.get('next_offset') if resume else None)
+                if not self.progress:
                     print(u'Continue next id')
         except Exception as e:
             print('Error: ', e)
             traceback.print_exc()
+            if self.coordinator and self.user_config:
+                # 出错的用户放回队列，计入失败次数
+                self.coordinator.release(self.user_config['user_id'], False)
+        self.close()
+
+    def close(self):
+        """等待写入、下载完成并释放连接"""
+        if self.sinks:
+            self.sinks.close()
+        self.long_text_executor.shutdown()
+        self.status_cache.print_stats()
+        self.status_cache.close()
+        self.downloader.close()
+        if 'mysql' in self.write_mode:
+            self.mysql.close()
+        if self.progress:
+            self.progress.close()
+        if self.coordinator:
+            self.coordinator.close()
+        if self.frontier:
+            self.frontier.print_stats()
+        if self.http_mode != LIVE:
+            self.archive.close()
+        if self.http_mode == REPLAY:
+            print(u'Replay: %d responses served, %d not in archive' %
+                  (self.api.hit_count, self.api.miss_count))
+        self.http.print_stats()
+        self.metrics.close()
+
+
+class AsyncWeibo(object):
+    """asyncio爬虫引擎，同时爬取多个用户"""
+    def __init__(self, config):
+        self.weibo = Weibo(config)
+        self.concurrency = config.get('concurrency', 1)
+        self.max_inflight = config.get('max_inflight', self.concurrency)
+        self.inflight = threading.BoundedSemaphore(self.max_inflight)
+        self.running = set()  # 正在爬取或爬取失败的用户所在行的偏移
+        self.dispatched = 0  # 已分派用户的最大下一行偏移
+        self.lock = threading.Lock()  # 保护共享的用户队列和running
+
+    def new_worker(self, user_config):
+        """为单个用户创建独立的爬虫状态，共享配置与在途请求上限"""
+        worker = copy.copy(self.weibo)
+        worker.inflight = self.inflight
+        worker.initialize_info(user_config)
+        return worker
+
+    def crawl_user(self, user_config):
+        """爬取单个用户，在线程池中运行，返回是否爬取成功"""
+        try:
+            print("spidering user", user_config['user_id'])
+            worker = self.new_worker(user_config)
+            worker.get_pages()
+            # 等待写入完成后才推进续爬位置
+            worker.finish_user(wait=True)
+            return True
+        except Exception as e:
+            print('Error: ', e)
+            traceback.print_exc()
+            if self.weibo.coordinator:
+                self.weibo.coordinator.release(user_config['user_id'], False)
+            return False
+
+    def next_user(self, user_configs):
+        """在线程池中取出下一个用户，coordinator等待其他进程的租约时会阻塞"""
+        with self.lock:
+            user_config = next(user_configs, None)
+            if user_config:
+                self.dispatch(user_config)
+            return user_config
+
+    async def run_worker(self, loop, executor, user_configs):
+        """从共享的用户队列中依次取出用户并爬取"""
+        while True:
+            user_config = await loop.run_in_executor(executor, self.next_user,
+                                                     user_configs)
+            if not user_config:
+                return
+            success = await loop.run_in_executor(executor, self.crawl_user,
+                                                 user_config)
+            with self.lock:
+                self.mark_done(user_config, success)
+
+    def dispatch(self, user_config):
+        if self.weibo.resumes_by_offset():
+            self.running.add(user_config['offset'])
+            self.dispatched = max(self.dispatched, user_config['next_offset'])
+
+    def mark_done(self, user_config, success=True):
+        """续爬位置只推进到仍在爬取或爬取失败的最靠前的用户"""
+        if self.weibo.resumes_by_offset():
+            if success:
+                # 失败的用户留在running中，重启后从该用户开始读取
+                self.running.discard(user_config['offset'])
+            if not self.weibo.can_resume():
+                return
+            self.weibo.user_loader.set_marker(
+                min(self.running) if self.running else self.dispatched)
+
+    async def crawl(self):
+        loop = asyncio.get_running_loop()
+        user_configs = (user_config
+                        for user_config in self.weibo.user_config_list
+                        if not user_config.get('ifPass'))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*[
+                self.run_worker(loop, executor, user_configs)
+                for i in range(self.concurrency)
+            ])
+
+    def start(self):
+        """运行爬虫"""
+        try:
+            asyncio.run(self.crawl())
+        except Exception as e:
+            print('Error: ', e)
+            traceback.print_exc()
+        self.weibo.close()
 
 
 def main():
@@ -992,7 +1370,10 @@ def main():
                 config = json.loads(f.read())
             except ValueError:
                 sys.exit(u'config.json')
-        wb = Weibo(config)
+        if config.get('concurrency', 1) > 1:
+            wb = AsyncWeibo(config)
+        else:
+            wb = Weibo(config)
 
         wb.start() # start
     except Exception as e:
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from records import WeiboRecord
+
+# 会随时间变化的字段，超过ttl后需要重新获取
+COUNT_FIELDS = ['attitudes_count', 'comments_count', 'reposts_count']
+
+
+class StatusCache(object):
+    """以微博id为键缓存解析后的完整微博，内存LRU加SQLite持久化
+
+    热门原创微博会作为大量用户的retweeted_status出现，缓存后不必重复
+    请求和解析m.weibo.cn/detail页面。正文不会变化，点赞、评论、转发数
+    超过ttl秒后视为过期。
+    """
+    def __init__(self,
+                 path,
+                 max_size=10000,
+                 max_disk_size=1000000,
+                 ttl=86400,
+                 enabled=True):
+        self.enabled = enabled  # 为False时不读写缓存，用于录制和回放
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS status (
+            id INTEGER PRIMARY KEY,
+            stored_at REAL NOT NULL,
+            data TEXT NOT NULL)""")
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS status_stored_at ON status(stored_at)')
+        self.put_count = 0
+        self.hit_count = 0
+        self.stale_count = 0
+        self.miss_count = 0
+
+    def remember(self, weibo_id, stored_at, weibo):
+        self.memory[weibo_id] = (stored_at, weibo)
+        self.memory.move_to_end(weibo_id)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def get(self, weibo_id):
+        """返回(微博副本, 计数字段是否未过期)，未缓存时返回(None, False)"""
+        if not self.enabled:
+            return None, False
+        weibo_id = int(weibo_id)
+        with self.lock:
+            entry = self.memory.get(weibo_id)
+            if entry:
+                self.memory.move_to_end(weibo_id)
+            else:
+                row = self.connection.execute(
+                    'SELECT stored_at, data FROM status WHERE id = ?',
+                    (weibo_id, )).fetchone()
+                if row:
+                    entry = (row[0], WeiboRecord.from_dict(json.loads(row[1])))
+                    self.remember(weibo_id, *entry)
+            if not entry:
+                self.miss_count += 1
+                return None, False
+            fresh = time.time() - entry[0] <= self.ttl
+            if fresh:
+                self.hit_count += 1
+            else:
+                self.stale_count += 1
+        return entry[1].copy(), fresh
+
+    def put(self, weibo):
+        if not self.enabled:
+            return
+        weibo_id = int(weibo['id'])
+        stored_at = time.time()
+        data = json.dumps(weibo.to_dict(), ensure_ascii=False)
+        with self.lock:
+            self.remember(weibo_id, stored_at, weibo.copy())
+            self.connection.execute(
+                'INSERT OR REPLACE INTO status VALUES (?, ?, ?)',
+                (weibo_id, stored_at, data))
+            self.put_count += 1
+            if self.put_count % 1000 == 0:
+                self.prune()
+
+    def prune(self):
+        """磁盘中的记录超过max_disk_size时删除最早写入的记录"""
+        count = self.connection.execute(
+            'SELECT COUNT(*) FROM status').fetchone()[0]
+        if count > self.max_disk_size:
+            self.connection.execute(
+                'DELETE FROM status WHERE id IN (SELECT id FROM status '
+                'ORDER BY stored_at LIMIT ?)', (count - self.max_disk_size, ))
+
+    def stats(self):
+        return {
+            'hits': self.hit_count,
+            'stale': self.stale_count,
+            'misses': self.miss_count,
+            'size': len(self.memory)
+        }
+
+    def print_stats(self):
+        print(u'Status cache: %(hits)d hits, %(stale)d stale, '
+              u'%(misses)d misses, %(size)d in memory' % self.stats())
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+from array import array
+from datetime import datetime
+
+from progress import DONE, MISSING
+
+RESUME_OFFSET = 'resume_offset'
+
+
+def is_date(since_date):
+    try:
+        datetime.strptime(since_date, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+class UserListLoader(object):
+    """逐行读取user_id_list文件，只产出尚未爬取的用户
+
+    已带日期或在进度数据库中记录过的用户直接跳过，不会整体读入内存。
+    每个用户带有所在行的字节偏移，爬取完成后保存为续爬位置，
+    重启时从该位置seek，近乎爬完的列表也能立刻开始爬取。
+    """
+    def __init__(self,
+                 file_path,
+                 since_date,
+                 progress=None,
+                 offset=None,
+                 resume_after='',
+                 recrawl=False):
+        self.file_path = file_path
+        self.since_date = since_date
+        self.progress = progress
+        self.resume_after = str(resume_after)
+        # recrawl为True时已爬取的用户也会产出，从上次爬取的日期开始增量爬取
+        self.recrawl = recrawl
+        if offset is None:
+            # 指定了resume_after或重新爬取时从头读取
+            if self.resume_after or self.recrawl:
+                offset = 0
+            else:
+                offset = self.get_marker()
+        self.offset = offset
+
+    def file_key(self):
+        # 文件内容变化后保存的偏移量失效，大小不变的修改由修改时间区分
+        stat = os.stat(self.file_path)
+        return '%d-%d' % (stat.st_size, stat.st_mtime_ns)
+
+    def get_marker(self):
+        if not self.progress:
+            return 0
+        marker = self.progress.get_meta(RESUME_OFFSET, '')
+        key, _, offset = marker.partition(':')
+        if offset and key == self.file_key():
+            return int(offset)
+        return 0
+
+    def set_marker(self, offset):
+        if self.progress and not self.recrawl:
+            self.progress.set_meta(RESUME_OFFSET,
+                                   '%s:%d' % (self.file_key(), offset))
+
+    def get_since_date(self, info):
+        """返回待爬取用户的since_date，无需爬取时返回None"""
+        crawled_date = ''
+        if len(info) > 2 and is_date(info[2]):
+            crawled_date = info[2]
+        if self.progress:
+            progress = self.progress.get(info[0])
+            if progress and progress[0] == MISSING:
+                return None
+            if progress and progress[0] == DONE and is_date(progress[2]):
+                crawled_date = progress[2]
+        if not crawled_date:
+            return self.since_date
+        if self.recrawl:
+            return crawled_date
+        return None
+
+    def iter_lines(self):
+        """产出(行首偏移, 下一行偏移, 按空格切分的行)"""
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.offset)
+            if self.offset:
+                # 偏移量不在行首时跳到下一行
+                f.seek(self.offset - 1)
+                if f.read(1) != b'\n':
+                    f.readline()
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                info = line.strip().decode('utf-8-sig').split(' ')
+                yield offset, f.tell(), info
+
+    def __iter__(self):
+        skipping = bool(self.resume_after)
+        for offset, next_offset, info in self.iter_lines():
+            if not (len(info) > 0 and info[0].isdigit()):
+                continue
+            if skipping:
+                skipping = info[0] != self.resume_after
+                continue
+            since_date = self.get_since_date(info)
+            if since_date:
+                yield {
+                    'user_id': info[0],
+                    'since_date': since_date,
+                    'ifPass': False,
+                    'offset': offset,
+                    'next_offset': next_offset
+                }
+
+    def pending_ids(self, since_dates=None):
+        """用array('Q')紧凑保存全部待爬取的用户id
+
+        since_date与默认值不同的用户记入since_dates，供需要整个待爬取集合的
+        CrawlFrontier使用，按文件顺序爬取时直接迭代即可。
+        """
+        ids = array('Q')
+        for user_config in self:
+            user_id = int(user_config['user_id'])
+            ids.append(user_id)
+            if (since_dates is not None
+                    and user_config['since_date'] != self.since_date):
+                since_dates.setdefault(user_id, user_config['since_date'])
+        return ids
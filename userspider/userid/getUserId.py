@@ -4,20 +4,23 @@ import random
 import numpy as np
 from numpy.random import default_rng
 import gc
-import time
 import json
 import math
+import os
 
 import sys
 import traceback
 
-import requests
-from requests.adapters import HTTPAdapter
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from http_client import HttpClient
+from rate_limiter import THROTTLE_STATUS, AdaptiveRateLimiter
 
 
 class Weibo(object):
     def __init__(self):
         self.test = 0
+        self.http = HttpClient()
+        self.limiter = AdaptiveRateLimiter()
         #self.true_user = self.load_np("/kaggle/working/user_list.npy")
         # self.random_user_id_list = np.array(random.sample(range(1000000000,5999999999), 10**8))
         #self.random_user_id_list = np.random.randint(1000000000,9999999999, size = 10**1)
@@ -28,7 +31,10 @@ class Weibo(object):
     def get_json(self, params):
         url = 'https://m.weibo.cn/api/container/getIndex?'
         # print("Requesting...")
-        r = requests.get(url, params=params)
+        self.limiter.acquire()
+        r = self.http.get(url, params=params)
+        # 不存在的用户同样返回ok为0，这里只按HTTP状态码判断是否被限制
+        self.limiter.observe(r.status_code not in THROTTLE_STATUS)
         return r.json()
 
     def get_user_info(self, user_id):
@@ -79,7 +85,7 @@ class Weibo(object):
             print("checking", user_id)
             # print(index, user_id)
             if index%30 == 0:
-                time.sleep(6)
+                self.limiter.print_stats()
             try:
                 if self.get_user_info(user_id):
                     print("The", user_id, "is exists")
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""并发探测用户id是否存在，已探测的id记录在位图中，跨多次运行不重复探测
+
+python probe.py --start 1000000000 --stop 1100000000 --workers 8
+python probe.py --random 1000000 --seed 1
+python probe.py --merge other/probed.bitmap other/found.bitmap
+python probe.py --stats
+
+探测结果保存在probed.bitmap(已探测)和found.bitmap(存在)中，每个id占一位，
+10^9到10^10的id各需约1.1GB的稀疏文件，内存占用与探测数量无关。
+存在的用户逐行追加到found_ids.txt，可直接作为user_id_list使用。
+其他机器或进程上的位图可用--merge合并，之后不会再探测其中的id；
+同时运行的多个进程应使用各自的位图文件。
+"""
+
+import argparse
+import os
+import sys
+import threading
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from http_client import HttpClient
+from rate_limiter import THROTTLE_STATUS, AdaptiveRateLimiter
+
+LOW = 10**9
+HIGH = 10**10
+CHUNK_SIZE = 1 << 26  # 合并、计数时每次处理的字节数
+
+
+class IdBitmap(object):
+    """[low, high)区间内每个id占一位的位图，保存在稀疏文件中并用memmap访问"""
+    def __init__(self, path, low=LOW, high=HIGH):
+        self.path = path
+        self.low = low
+        self.high = high
+        size = (high - low + 7) // 8
+        if not os.path.isfile(path) or os.path.getsize(path) < size:
+            with open(path, 'ab') as f:
+                f.truncate(size)
+        self.bits = np.memmap(path, dtype=np.uint8, mode='r+', shape=(size, ))
+        self.lock = threading.Lock()
+
+    def __contains__(self, user_id):
+        i = int(user_id) - self.low
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def add(self, user_id):
+        i = int(user_id) - self.low
+        with self.lock:
+            self.bits[i >> 3] |= 1 << (i & 7)
+
+    def contains_many(self, ids):
+        """ids为np.int64数组，返回对应的bool数组"""
+        i = ids - self.low
+        return (self.bits[i >> 3] >> (i & 7).astype(np.uint8)) & 1 == 1
+
+    def merge(self, other):
+        """按位或合并另一个同一区间的位图"""
+        if (other.low, other.high) != (self.low, self.high):
+            sys.exit(u'%s covers a different id range' % other.path)
+        for start in range(0, len(self.bits), CHUNK_SIZE):
+            chunk = other.bits[start:start + CHUNK_SIZE]
+            if chunk.any():
+                with self.lock:
+                    self.bits[start:start + CHUNK_SIZE] |= chunk
+
+    def count(self):
+        count = 0
+        for start in range(0, len(self.bits), CHUNK_SIZE):
+            chunk = self.bits[start:start + CHUNK_SIZE]
+            if chunk.any():
+                count += int(np.unpackbits(chunk).sum())
+        return count
+
+    def flush(self):
+        with self.lock:
+            self.bits.flush()
+
+
+class UserIdProber(object):
+    """多个线程共用一个限速器，探测candidates中尚未探测过的id"""
+    def __init__(self,
+                 probed,
+                 found,
+                 output_path,
+                 workers=8,
+                 api_base='https://m.weibo.cn',
+                 rate_limit=None,
+                 flush_interval=30):
+        self.probed = probed
+        self.found = found
+        self.output_path = output_path
+        self.workers = workers
+        self.api_base = api_base
+        self.flush_interval = flush_interval
+        self.http = HttpClient(pool_maxsize=workers)
+        self.limiter = AdaptiveRateLimiter(**(rate_limit or {}))
+        self.lock = threading.Lock()
+        self.output = None
+        self.candidates = None
+        self.probe_count = 0
+        self.found_count = 0
+        self.error_count = 0
+
+    def probe(self, user_id):
+        """返回用户是否存在，被限制或出错时返回None"""
+        self.limiter.acquire()
+        try:
+            r = self.http.get(self.api_base + '/api/container/getIndex?',
+                              params={'containerid': '107603' + str(user_id)})
+            if r.status_code in THROTTLE_STATUS:
+                self.limiter.throttle()
+                return None
+            # 不存在的用户同样返回ok为0，这里只按HTTP状态码判断是否被限制
+            self.limiter.success()
+            return bool(r.json().get('ok'))
+        except Exception as e:
+            print('Error: ', e)
+            with self.lock:
+                self.error_count += 1
+            return None
+
+    def record(self, user_id, exists):
+        if exists:
+            self.found.add(user_id)
+            with self.lock:
+                self.output.write('%d\n' % user_id)
+                self.output.flush()
+                self.found_count += 1
+        self.probed.add(user_id)
+        with self.lock:
+            self.probe_count += 1
+
+    def next_id(self):
+        with self.lock:
+            return next(self.candidates, None)
+
+    def run(self):
+        while True:
+            user_id = self.next_id()
+            if user_id is None:
+                return
+            for i in range(3):
+                exists = self.probe(user_id)
+                if exists is not None:
+                    self.record(user_id, exists)
+                    break
+
+    def print_stats(self):
+        print(u'%d probed, %d found, %d errors' %
+              (self.probe_count, self.found_count, self.error_count))
+        self.limiter.print_stats()
+
+    def start(self, candidates):
+        self.candidates = iter(candidates)
+        self.output = open(self.output_path, 'a')
+        threads = [
+            threading.Thread(target=self.run) for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            while threads:
+                # 每flush_interval秒把位图写回磁盘并打印进度
+                threads[0].join(self.flush_interval)
+                threads = [thread for thread in threads if thread.is_alive()]
+                self.probed.flush()
+                self.found.flush()
+                self.print_stats()
+        finally:
+            self.probed.flush()
+            self.found.flush()
+            self.output.close()
+            self.http.print_stats()
+
+
+def unprobed(probed, blocks):
+    """过滤掉已探测的id，blocks产出np.int64数组"""
+    for block in blocks:
+        block = block[(block >= probed.low) & (block < probed.high)]
+        for user_id in block[~probed.contains_many(block)]:
+            yield int(user_id)
+
+
+def range_blocks(start, stop, block_size=100000):
+    for block_start in range(start, stop, block_size):
+        yield np.arange(block_start,
+                        min(block_start + block_size, stop),
+                        dtype=np.int64)
+
+
+def random_blocks(count, low, high, seed=None, block_size=100000):
+    rng = np.random.default_rng(seed)
+    while count > 0:
+        block = np.unique(
+            rng.integers(low, high, size=min(block_size, count),
+                         dtype=np.int64))
+        rng.shuffle(block)
+        count -= len(block)
+        yield block
+
+
+def main():
+    file_dir = os.path.split(os.path.realpath(__file__))[0]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start', type=int, default=LOW)
+    parser.add_argument('--stop', type=int, default=HIGH)
+    parser.add_argument('--random',
+                        type=int,
+                        default=0,
+                        help='probe this many random ids in [start, stop)')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=0.5)
+    parser.add_argument('--max-rate', type=float, default=5.0)
+    parser.add_argument('--probed', default=file_dir + os.sep + 'probed.bitmap')
+    parser.add_argument('--found', default=file_dir + os.sep + 'found.bitmap')
+    parser.add_argument('--output',
+                        default=file_dir + os.sep + 'found_ids.txt')
+    parser.add_argument('--api-base', default='https://m.weibo.cn')
+    parser.add_argument('--merge',
+                        nargs=2,
+                        metavar=('PROBED', 'FOUND'),
+                        help='merge the bitmaps of another machine')
+    parser.add_argument('--stats', action='store_true')
+    args = parser.parse_args()
+
+    probed = IdBitmap(args.probed)
+    found = IdBitmap(args.found)
+    if args.merge:
+        probed.merge(IdBitmap(args.merge[0]))
+        found.merge(IdBitmap(args.merge[1]))
+        probed.flush()
+        found.flush()
+    if args.merge or args.stats:
+        print(u'%d probed, %d found' % (probed.count(), found.count()))
+        return
+
+    if args.random:
+        blocks = random_blocks(args.random, args.start, args.stop, args.seed)
+    else:
+        blocks = range_blocks(args.start, args.stop)
+    prober = UserIdProber(probed,
+                          found,
+                          args.output,
+                          workers=args.workers,
+                          api_base=args.api_base,
+                          rate_limit={
+                              'rate': args.rate,
+                              'max_rate': args.max_rate
+                          })
+    try:
+        prober.start(unprobed(probed, blocks))
+    except KeyboardInterrupt:
+        pass
+    prober.print_stats()
+
+
+if __name__ == '__main__':
+    main()
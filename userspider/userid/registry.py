@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""用户id登记表：每个集合保存为排好序、去重的uint64数组文件
+
+python registry.py import all user_data/all_id_exclude_done*.txt
+python registry.py import finished user_data/all_id_finished.txt userid/done/*.txt
+python registry.py import probed userid/user_list.txt --column 1
+python registry.py diff todo all finished
+python registry.py export todo user_data/todo.txt --shards 4
+python registry.py contains finished 1669879400
+python registry.py list
+
+集合保存在registry目录下的<name>.u64中，用memmap读取，并、差、交
+均为numpy的向量化运算。export写出Weibo可直接读取的user_id_list文件。
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+REGISTRY_DIR = os.path.split(os.path.realpath(__file__))[0] + os.sep + 'registry'
+SUFFIX = '.u64'
+
+
+def parse_ids(file_path, column=0):
+    """读取文本文件每行第column列的数字id，其余格式的行跳过"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    if data.startswith(b'\xef\xbb\xbf'):
+        data = data[3:]
+    pattern = re.compile(rb'^(?:[^\S\n]*\S+[^\S\n]+){%d}(\d+)(?!\S)' % column,
+                         re.M)
+    return np.array(pattern.findall(data), dtype=np.uint64)
+
+
+def sorted_unique(ids):
+    """排序去重，比np.unique快"""
+    ids = np.sort(ids)
+    if len(ids):
+        ids = ids[np.concatenate(([True], ids[1:] != ids[:-1]))]
+    return ids
+
+
+class IdRegistry(object):
+    """按名称保存的id集合，集合内容为升序且不重复的uint64数组"""
+    def __init__(self, path=REGISTRY_DIR):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def set_path(self, name):
+        return self.path + os.sep + name + SUFFIX
+
+    def names(self):
+        return sorted(file_name[:-len(SUFFIX)]
+                      for file_name in os.listdir(self.path)
+                      if file_name.endswith(SUFFIX))
+
+    def get(self, name):
+        path = self.set_path(name)
+        if not os.path.isfile(path):
+            sys.exit(u'%s non-exists' % path)
+        if not os.path.getsize(path):
+            return np.array([], dtype=np.uint64)
+        return np.memmap(path, dtype=np.uint64, mode='r')
+
+    def put(self, name, ids):
+        """先写入临时文件再替换，中断时不会留下不完整的集合"""
+        path = self.set_path(name)
+        tmp_path = path + '.tmp'
+        np.asarray(ids, dtype=np.uint64).tofile(tmp_path)
+        os.replace(tmp_path, path)
+        return len(ids)
+
+    def import_files(self, name, file_paths, column=0):
+        """把文本文件中的id并入集合，集合不存在时新建"""
+        ids = [parse_ids(file_path, column) for file_path in file_paths]
+        if name in self.names():
+            ids.append(self.get(name))
+        return self.put(name, sorted_unique(np.concatenate(ids)))
+
+    def union(self, name, others):
+        return self.put(
+            name, sorted_unique(np.concatenate([self.get(n) for n in others])))
+
+    def difference(self, name, first, others):
+        ids = self.get(first)
+        for other in others:
+            ids = np.setdiff1d(ids, self.get(other), assume_unique=True)
+        return self.put(name, ids)
+
+    def intersection(self, name, first, others):
+        ids = self.get(first)
+        for other in others:
+            ids = np.intersect1d(ids, self.get(other), assume_unique=True)
+        return self.put(name, ids)
+
+    def contains(self, name, ids):
+        """ids中每个id是否在集合中，按二分查找判断"""
+        ids = np.asarray(ids, dtype=np.uint64)
+        members = self.get(name)
+        if not len(members):
+            return np.zeros(len(ids), dtype=bool)
+        index = np.searchsorted(members, ids)
+        index[index == len(members)] = 0
+        return members[index] == ids
+
+    def export(self, name, file_path, shards=1):
+        """写出每行一个id的user_id_list文件，shards大于1时平均分成多个文件"""
+        ids = self.get(name)
+        if shards == 1:
+            file_paths = [file_path]
+        else:
+            root, ext = os.path.splitext(file_path)
+            file_paths = ['%s_%d%s' % (root, i, ext) for i in range(shards)]
+        for file_path, part in zip(file_paths, np.array_split(ids, shards)):
+            with open(file_path, 'wb') as f:
+                if len(part):
+                    f.write('\n'.join(map(str, part.tolist())).encode('utf-8'))
+                    f.write(b'\n')
+        return file_paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--registry', default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('import')
+    command.add_argument('name')
+    command.add_argument('files', nargs='+')
+    command.add_argument('--column', type=int, default=0)
+    for operation in ['union', 'diff', 'intersect']:
+        command = commands.add_parser(operation)
+        command.add_argument('name')
+        command.add_argument('sets', nargs='+')
+    command = commands.add_parser('export')
+    command.add_argument('name')
+    command.add_argument('file')
+    command.add_argument('--shards', type=int, default=1)
+    command = commands.add_parser('contains')
+    command.add_argument('name')
+    command.add_argument('ids', nargs='+', type=int)
+    commands.add_parser('list')
+    args = parser.parse_args()
+
+    registry = IdRegistry(args.registry)
+    if args.command == 'import':
+        count = registry.import_files(args.name, args.files, args.column)
+        print(u'%s: %d ids' % (args.name, count))
+    elif args.command == 'union':
+        print(u'%s: %d ids' % (args.name, registry.union(args.name,
+                                                         args.sets)))
+    elif args.command == 'diff':
+        print(u'%s: %d ids' % (args.name,
+                               registry.difference(args.name, args.sets[0],
+                                                   args.sets[1:])))
+    elif args.command == 'intersect':
+        print(u'%s: %d ids' % (args.name,
+                               registry.intersection(args.name, args.sets[0],
+                                                     args.sets[1:])))
+    elif args.command == 'export':
+        for file_path in registry.export(args.name, args.file, args.shards):
+            print(file_path)
+    elif args.command == 'contains':
+        for user_id, found in zip(args.ids,
+                                  registry.contains(args.name, args.ids)):
+            print(u'%d %s' % (user_id, 'yes' if found else 'no'))
+    elif args.command == 'list':
+        for name in registry.names():
+            print(u'%s: %d ids' % (name, len(registry.get(name))))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
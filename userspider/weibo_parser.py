@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+from lxml import etree
+
+LOCATION_ICON = 'timeline_card_small_location_default.png'
+
+
+def string_value(element):
+    """等同于element.xpath('string(.)')"""
+    return ''.join(element.itertext())
+
+
+def first_img_src(span):
+    """等同于span.xpath('img/@src')[0]，没有时返回None"""
+    for child in span:
+        if child.tag == 'img':
+            src = child.get('src')
+            if src is not None:
+                return src
+    return None
+
+
+def parse_text(text_body):
+    """一次解析、一次遍历得到微博正文、位置、话题和@用户
+
+    返回(text, location, topics, at_users)，结果与Weibo.get_location、
+    get_topics、get_at_users及xpath('string(.)')完全一致。
+    """
+    selector = etree.HTML(text_body)
+    text = selector.xpath('string(.)')
+    location = ''
+    location_next = False
+    location_found = False
+    topic_list = []
+    at_list = []
+    for element in selector.iter('span', 'a'):
+        if element.tag == 'a':
+            content = string_value(element)
+            if '@' + element.attrib['href'][3:] == content:
+                at_list.append(content[1:])
+            continue
+        if location_next:
+            location = string_value(element)
+            location_next = False
+            location_found = True
+        elif not location_found:
+            src = first_img_src(element)
+            if src is not None and LOCATION_ICON in src:
+                location_next = True
+        if element.get('class') == 'surl-text':
+            content = string_value(element)
+            if len(content) > 2 and content[0] == '#' and content[-1] == '#':
+                topic_list.append(content[1:-1])
+    if location_next:
+        # 与原实现一致，位置图标后没有span时抛出IndexError
+        raise IndexError('list index out of range')
+    return text, location, ','.join(topic_list), ','.join(at_list)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import threading
+import traceback
+from queue import Queue
+
+
+class Barrier(object):
+    """所有写入线程都处理到这里后执行callback，即之前提交的批次已全部写入"""
+    def __init__(self, count, callback):
+        self.count = count
+        self.callback = callback
+        self.lock = threading.Lock()
+
+    def arrive(self):
+        with self.lock:
+            self.count -= 1
+            if self.count:
+                return
+        try:
+            self.callback()
+        except Exception as e:
+            print('Error: ', e)
+            traceback.print_exc()
+
+
+class WriteBehind(object):
+    """后台写入，爬取线程提交批次后继续翻页
+
+    每种写入方式一个线程，各自从有界队列中按提交顺序取出批次写入，同一文件
+    的写入顺序不变。队列已满时submit阻塞，写入跟不上时限制爬取速度。
+    各写入线程共享同一个批次对象，批次提交后不能再修改。
+    """
+    def __init__(self, sinks, queue_size=4):
+        self.queues = []
+        self.threads = []
+        self.failed = set()
+        self.error_count = 0
+        self.lock = threading.Lock()
+        for name, write in sinks.items():
+            queue = Queue(maxsize=queue_size)
+            thread = threading.Thread(target=self.run,
+                                      args=(write, queue),
+                                      name='sink-' + name)
+            thread.daemon = True
+            thread.start()
+            self.queues.append(queue)
+            self.threads.append(thread)
+
+    def run(self, write, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if isinstance(item, Barrier):
+                item.arrive()
+                continue
+            key, batch, wrote_count = item
+            try:
+                write(batch, wrote_count)
+            except (Exception, SystemExit) as e:
+                # SystemExit也要捕获，否则写入线程退出，队列不再消费，爬取一直阻塞
+                print('Error: ', e)
+                traceback.print_exc()
+                with self.lock:
+                    self.failed.add(key)
+                    self.error_count += 1
+
+    def submit(self, key, batch, wrote_count):
+        """提交一个批次，写入失败时记录key"""
+        for queue in self.queues:
+            queue.put((key, batch, wrote_count))
+
+    def after(self, callback):
+        """之前提交的批次全部写入后在写入线程中执行callback"""
+        if not self.queues:
+            callback()
+            return
+        barrier = Barrier(len(self.queues), callback)
+        for queue in self.queues:
+            queue.put(barrier)
+
+    def pop_failed(self, key):
+        """返回key的批次是否有写入失败，并清除记录"""
+        with self.lock:
+            if key in self.failed:
+                self.failed.discard(key)
+                return True
+            return False
+
+    def close(self):
+        """写完队列中剩余的批次后退出"""
+        for queue in self.queues:
+            queue.put(None)
+        for thread in self.threads:
+            thread.join()